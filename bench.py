@@ -0,0 +1,208 @@
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from lcdzilla import lcdzilla
+from lcdzilla_backend import SimulatedBackend
+
+# Benchmarks for the lcdzilla navigation and editing hot paths. Every scenario runs against
+# the simulated display and reports wall time, Python memory use and the bus traffic it
+# caused, as JSON so CI can compare runs.
+
+ALPHA_LOWER = "abcdefghijklmnopqrstuvwxyz"
+ALPHA_UPPER = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+SYMBOLS = " !\"#$%&'()*+,-./:;<=>?@[]^_{|}~"
+NUMBERS = "0123456789"
+
+
+def make_display(num_lines=4, num_characters=20, batched=False):
+    display = lcdzilla(None, None, None, None, num_lines=num_lines, num_characters=num_characters,
+                       backend=SimulatedBackend(num_lines, num_characters, batched=batched))
+    display.set_alpha_lower(ALPHA_LOWER)
+    display.set_alpha_upper(ALPHA_UPPER)
+    display.set_symbols(SYMBOLS)
+    display.set_numbers(NUMBERS)
+    display.set_character_set_key("*")
+    display.set_bkspc_key("#")
+    return display
+
+
+def make_menu(num_rows, name="Entry", values=True):
+    # A menu of selectable entries, each followed by a value unless values is False
+    menu = []
+    for row in range(num_rows):
+        line = [{"text": "{0} {1}".format(name, row), "select": True}]
+        if values:
+            line.append({"text": "val {0}".format(row)})
+        menu.append(line)
+    return menu
+
+
+# Each scenario takes a display, does its setup and returns the function to measure
+
+def load_large_screen(display):
+    # Every load is a screen that hasn't been shown before, so each one is compiled and
+    # drawn over a display showing different text
+    screens = [make_menu(1000, ALPHA_UPPER[screen] * 6) for screen in range(20)]
+
+    def run():
+        for screen in screens:
+            display.load_screen(screen)
+    return run
+
+
+def reload_cached_screen(display):
+    # Switch between screens that are already in the layout cache. Their content differs,
+    # so each load still redraws the display.
+    screens = [make_menu(1000, ALPHA_UPPER[screen] * 6) for screen in range(4)]
+    for screen in screens:
+        display.load_screen(screen)
+
+    def run():
+        for _ in range(5):
+            for screen in screens:
+                display.load_screen(screen)
+    return run
+
+
+def scroll_menu(display):
+    menu = make_menu(1000)
+    display.load_screen(menu)
+
+    def run():
+        for _ in range(len(menu)):
+            display.cursor_down()
+        for _ in range(len(menu)):
+            display.cursor_up()
+    return run
+
+
+def edit_text(display):
+    screen = [[{"text": "Name:"}],
+              [{"text": "", "select": True, "edit": True, "max_len": 20}]]
+    display.load_screen(screen)
+
+    def run():
+        for position in range(20):
+            for _ in range(position % 7 + 1):
+                display.cursor_up()
+            if position % 5 == 4:
+                display.sel_character_set()
+            display.cursor_right()
+    return run
+
+
+def edit_number(display):
+    screen = [[{"text": "Level:"}],
+              [{"text": 50, "select": True, "edit": True, "type": "number", "min_value": 0, "max_value": 100}]]
+    display.load_screen(screen)
+
+    def run():
+        for _ in range(80):
+            display.cursor_up()
+        for _ in range(150):
+            display.cursor_down()
+    return run
+
+
+SCENARIOS = {
+    "load_large_screen": load_large_screen,
+    "reload_cached_screen": reload_cached_screen,
+    "scroll_menu": scroll_menu,
+    "edit_text": edit_text,
+    "edit_number": edit_number,
+}
+
+
+def run_scenario(scenario, repeat, batched=False):
+
+    # Time the scenario on fresh displays and keep the best run
+    wall_times = []
+    for _ in range(repeat):
+        run = scenario(make_display(batched=batched))
+        start = time.perf_counter()
+        run()
+        wall_times.append(time.perf_counter() - start)
+
+    # Run once more to measure the memory used and the bus traffic. tracemalloc only sees
+    # the blocks still alive at the end, so the count is what the run kept hold of, not
+    # everything it allocated along the way.
+    display = make_display(batched=batched)
+    run = scenario(display)
+    backend = display.get_backend()
+    backend.reset_stats()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    run()
+    after = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    retained_blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+    stats = backend.stats()
+
+    return {
+        "wall_time": min(wall_times),
+        "retained_blocks": retained_blocks,
+        "peak_memory": peak,
+        "commands": stats["commands"],
+        "data_bytes": stats["data_bytes"],
+        "bus_bytes": stats["i2c_bytes"],
+        "bus_transactions": stats["i2c_transactions"],
+        "bus_time": stats["bus_time"],
+    }
+
+
+def compare(results, baseline, tolerance):
+
+    # Bus traffic is deterministic so any increase is a regression. Wall time is noisy so it
+    # only counts when it is worse than the tolerance allows.
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if result["bus_bytes"] > base["bus_bytes"]:
+            regressions.append("{0}: bus bytes {1} > {2}".format(name, result["bus_bytes"], base["bus_bytes"]))
+        if result["wall_time"] > base["wall_time"] * (1 + tolerance):
+            regressions.append("{0}: wall time {1:.6f} > {2:.6f}".format(name, result["wall_time"], base["wall_time"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark lcdzilla against a simulated display")
+    parser.add_argument("scenarios", nargs="*", help="scenarios to run: {0} (default all)".format(", ".join(sorted(SCENARIOS))))
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per scenario")
+    parser.add_argument("--batched", action="store_true", help="model the batched PCF8574 backend")
+    parser.add_argument("--output", help="write the results to this file instead of stdout")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed wall time slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    names = args.scenarios or sorted(SCENARIOS)
+    for name in names:
+        if name not in SCENARIOS:
+            parser.error("unknown scenario: {0}".format(name))
+    results = {}
+    for name in names:
+        results[name] = run_scenario(SCENARIOS[name], args.repeat, args.batched)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print("Regression: " + regression, file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
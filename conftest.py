@@ -0,0 +1,34 @@
+from bench import make_display, make_menu
+
+# Helpers shared by the tests. Displays and menus are built the same way as in the
+# benchmarks: a simulated display with every character set defined.
+
+def pad(text, width=20):
+    # A display line holding text
+    return "{0:{1}}".format(text, width)
+
+
+def clears(display):
+    return display.get_backend().stats()["operations"].get("clear", {}).get("count", 0)
+
+
+class FakeI2C:
+
+    # Stands in for a busio.I2C and records what is written to it as (address, bytes)
+    def __init__(self):
+        self.writes = []
+
+    def try_lock(self):
+        return True
+
+    def unlock(self):
+        pass
+
+    def writeto(self, addr, buffer, end=None):
+        self.writes.append((addr, bytes(buffer[:end])))
+
+
+def text_screen(text=""):
+    # A screen with one text field being edited
+    return [[{"text": "Name:"}],
+            [{"text": text, "select": True, "edit": True, "max_len": 10}]]
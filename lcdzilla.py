@@ -1,18 +1,30 @@
-import math
-from lcd.lcd import LCD, LCD_BACKLIGHT, LCD_NOBACKLIGHT
-from lcd.i2c_pcf8574_interface import I2CPCF8574Interface
-from lcd.lcd import CursorMode
-import busio
-import board
+import contextlib
+import threading
+import time
+from collections import OrderedDict
+from lcdzilla_layout import compile_screen, is_lazy, same_content, screen_signature
+from lcdzilla_charset import CharacterSet
+from lcdzilla_backend import CURSOR_HIDE, CURSOR_BLINK, PCF8574Backend, SimulatedBackend
 
 class lcdzilla:
 
     LCD_PFC8574 = 1
     LCD_HD44789 = 2
+    LCD_SIMULATED = 3
     SCROLL_DOWN = 1
     SCROLL_UP = -1
+    # Relative cost of display operations measured in character writes. Moving the
+    # cursor is a single command byte, clearing the display takes about as long as
+    # writing 40 characters on a HD44780.
+    CURSOR_MOVE_COST = 1
+    CLEAR_COST = 40
+    # Number of custom character slots in the display's CGRAM
+    CGRAM_SLOTS = 8
+    # Minimum seconds between refreshes of a bound field that doesn't set its own interval
+    BIND_INTERVAL = 0.1
 
-    def __init__(self, display_type, addr, scl_pin, sda_pin, num_lines=4, num_characters=20):
+    def __init__(self, display_type, addr, scl_pin, sda_pin, num_lines=4, num_characters=20, backend=None,
+                 init_display=True, splash=None):
 
         self._display_type = display_type
         self._addr = addr
@@ -21,55 +33,180 @@ class lcdzilla:
         self._first_visible_line = None
         self._last_visible_line = None
         self._screen_def = None
-        self._alpha_lower_characters = ""
-        self._alpha_upper_characters = ""
-        self._symbol_characters = ""
-        self._numbers = ""
+        # Character sets for text editing by name, and the order sel_character_set cycles
+        # through them
+        self._character_sets = {}
+        self._character_set_order = ["lower", "upper", "symbols", "numbers"]
         self._cur_character_set = None
         self._char_set_key = ""
         self._bkspc_key = ""
-        self._cursor_positions = None
+        self._layout = None
+        self._layout_cache = OrderedDict()
+        self._layout_cache_size = 32
+        # Screens likely to be shown next, keyed by the id of the screen they follow, and
+        # the screens waiting to be compiled ahead of time
+        self._next_screens = {}
+        self._prefetch_queue = OrderedDict()
+        # Lazy screens prefetched without a version, kept until they are next shown
+        self._prefetched = OrderedDict()
+        # Set by switch_screen so the next update diffs against the shadow instead of
+        # clearing the display
+        self._avoid_clear = False
         self._cur_row = -1
         self._cur_field = -1
         self._edit_mode = False
         self._edit_numbers = False
         self._edit_pos = 0
         self._edit_item = []
+        self._edit_field = None
         self._scl_pin = scl_pin
         self._sda_pin = sda_pin
         self._debug = False
         self._char_set_key_label = ""
         self._first_visible_row = -1
         self._last_visible_row = -1
+        # The frame is what we want on the display, the shadow is what we believe is
+        # on the display right now. A shadow row of None means its contents are unknown.
+        self._frame = [" " * self._num_characters for _ in range(self._num_lines)]
+        self._shadow = [None] * self._num_lines
+        self._cursor = [0, 0]
+        self._cursor_mode = CURSOR_HIDE
+        self._shadow_cursor = None
+        self._shadow_cursor_mode = None
+        # Background writer state. The lock keeps the writer from copying a frame that is
+        # half way through being rebuilt.
+        self._lock = threading.RLock()
+        self._writer = None
+        self._writer_condition = threading.Condition()
+        self._writer_stop = False
+        self._writer_error = None
+        self._frame_generation = 0
+        self._synced_generation = 0
+        self._manager = None
+        self._instrumentation = None
+        # Changes made inside batch() are sent in one update when the outermost batch ends
+        self._batch_depth = 0
+        self._batch_changed = False
+        # Custom glyphs. The LRU maps each resident glyph to its CGRAM slot, least recently
+        # used first, and the table translates glyphs to their slot or the fallback text.
+        self._glyphs = None
+        self._glyph_lru = OrderedDict()
+        self._glyph_table = {}
+        # Live bound fields on the visible rows, keyed by (line, subfield), with the last
+        # rendered text, when each field is next due and values pushed in early
+        self._bindings = []
+        self._bound_values = {}
+        self._binding_due = {}
+        self._pushed_values = {}
+        # Number edit acceleration, off until set_number_acceleration turns it on
+        self._repeat_window = 0.25
+        self._presses_per_step = 0
+        self._max_step_exponent = 3
+        self._repeat_direction = 0
+        self._repeat_count = 0
+        self._repeat_time = 0.0
 
-
-        try:
-            # Here we will build an interface for the supported display
-            self._i2c = busio.I2C(self._scl_pin, self._sda_pin)
-            if self._display_type == self.LCD_PFC8574:
-                self._lcd = LCD(I2CPCF8574Interface(self._i2c, self._addr),
-                                num_rows=self._num_lines, num_cols=self._num_characters)
-        except Exception as e:
-            raise Exception("Error trying to create connection to LCD: {0}".format(e))
-        
-        # Clear the LCD and hide the cursor
-        self._lcd.set_cursor_mode(CursorMode.HIDE)
-        self._lcd.clear()
+        # Here we will build a backend for the supported display unless one was given
+        if backend is not None:
+            self._lcd = backend
+        elif self._display_type == self.LCD_SIMULATED:
+            self._lcd = SimulatedBackend(self._num_lines, self._num_characters)
+        elif self._display_type == self.LCD_PFC8574:
+            try:
+                self._lcd = PCF8574Backend(self._addr, self._scl_pin, self._sda_pin,
+                                           num_lines=self._num_lines, num_characters=self._num_characters)
+            except Exception as e:
+                raise Exception("Error trying to create connection to LCD: {0}".format(e))
+        else:
+            raise Exception("Unsupported display type: {0}".format(self._display_type))
         
+        # A backend that starts blank has cleared the display already. Otherwise clear it and
+        # hide the cursor, unless a splash screen is about to be written or the caller is
+        # about to load a screen and the first update will overwrite the whole display anyway.
+        blank = self._lcd.starts_blank
+        if not blank and init_display and splash is None:
+            self._lcd.set_cursor_mode(CURSOR_HIDE)
+            self._lcd.clear()
+            self._lcd.flush()
+            blank = True
+        if blank:
+            self._shadow = list(self._frame)
+            self._shadow_cursor = [0, 0]
+            self._shadow_cursor_mode = CURSOR_HIDE
+
+        # A splash screen goes straight onto the display in place of the clear. When the
+        # display isn't known to be blank every row is written so nothing that was there
+        # before is left behind.
+        if splash is not None:
+            self._frame = self._splash_lines(splash)
+            self._avoid_clear = True
+            self.sync_display()
+
+    def _splash_lines(self, splash):
+        # splash can be a list of strings, a screen definition or a screen compiled ahead of
+        # time with lcdzilla_layout.compile_screen
+        if isinstance(splash, (list, tuple)) and all(isinstance(line, str) for line in splash):
+            lines = list(splash)
+        else:
+            if not hasattr(splash, "row"):
+                splash = compile_screen(splash, self._num_characters)
+            lines = [splash.row(line_idx).text for line_idx in range(min(splash.num_rows, self._num_lines))]
+        lines = lines[:self._num_lines] + [""] * (self._num_lines - len(lines))
+        return [("{0:" + str(self._num_characters) + "." + str(self._num_characters) + "}").format(line)
+                for line in lines]
+
+    def get_backend(self):
+        return self._lcd
+
+    def get_screen(self):
+        # The screen definition being shown
+        return self._screen_def
+
+    def is_editing(self):
+        return self._edit_mode
+
+    def set_instrumentation(self, instrumentation):
+        # Count and time the operations of this display with an Instrumentation object, or
+        # stop when None is given
+        if self._instrumentation is not None:
+            self._instrumentation.detach(self)
+        self._instrumentation = instrumentation
+        if instrumentation is not None:
+            instrumentation.attach(self)
+
     def set_debug(self, debug_value):
         self._debug = debug_value
         
     def set_alpha_lower(self, alpha_lower_characters):
-        self._alpha_lower_characters = alpha_lower_characters
+        self.add_character_set("lower", alpha_lower_characters, "Lowr")
 
     def set_alpha_upper(self, alpha_upper_characters):
-        self._alpha_upper_characters = alpha_upper_characters
+        self.add_character_set("upper", alpha_upper_characters, "Uppr")
         
     def set_symbols(self, symbol_characters):
-        self._symbol_characters = symbol_characters
+        self.add_character_set("symbols", symbol_characters, "Symb")
 
     def set_numbers(self, numbers):
-        self._numbers = numbers
+        self.add_character_set("numbers", numbers, "Numb")
+
+    def add_character_set(self, name, characters, label=None):
+        # Add or replace a character set. New sets go on the end of the cycle order. An
+        # empty set removes the set.
+        if not len(characters):
+            self._character_sets.pop(name, None)
+            return
+        self._character_sets[name] = CharacterSet(name, characters, label)
+        if name not in self._character_set_order:
+            self._character_set_order.append(name)
+
+    def set_character_set_order(self, names):
+        # Order sel_character_set cycles through the sets in. The first set is also the
+        # default when the text being edited doesn't say which set to start with.
+        self._character_set_order = list(names)
+
+    def _cycle_character_sets(self):
+        # The character sets that have been defined, in cycle order
+        return [self._character_sets[name] for name in self._character_set_order if name in self._character_sets]
 
     def set_character_set_key(self, key):
         self._char_set_key = key
@@ -82,117 +219,339 @@ class lcdzilla:
 
     def set_cursor_position(self, cursor_position):
         self._cur_row = cursor_position[0]
-        self._cursor_positions = cursor_position[1]
+        self._cur_field = cursor_position[1]
+
+    def set_layout_cache_size(self, size):
+        self._layout_cache_size = size
+        while len(self._layout_cache) > self._layout_cache_size:
+            self._layout_cache.popitem(last=False)
+
+    def compile_screen(self, screen_def, version=None):
+
+        # screen_def is either a list of lines or a sequence-like source such as a
+        # VirtualScreen, which is compiled lazily a row at a time.
+        # Compiled layouts are cached by the identity of the screen definition and a version.
+        # An application that gives a version bumps it when it changes anything other than
+        # the field being edited, and the cached layout is trusted until it does. Without a
+        # version the cached layout is only used while the definition has the same content as
+        # when it was compiled, and a lazy source, which can't be checked, is compiled again
+        # unless it was prefetched since it was last shown. Checking the content compares the
+        # whole definition, which on a long menu still costs several times the rest of a
+        # cached reload, so screens that are shown often are best given a version.
+        # The cache holds a reference to the definition so its id can't be reused.
+        if version is None and is_lazy(screen_def):
+            layout = self._prefetched.pop(id(screen_def), None)
+            if layout is not None and layout.source is screen_def:
+                return layout
+            return compile_screen(screen_def, self._num_characters, version)
+        key = (id(screen_def), version)
+        entry = self._layout_cache.get(key)
+        if entry is not None and entry[0].source is screen_def:
+            if version is not None or same_content(screen_def, entry[1]):
+                self._layout_cache.move_to_end(key)
+                return entry[0]
+        layout = compile_screen(screen_def, self._num_characters, version)
+        if version is None:
+            signature = screen_signature(screen_def)
+        else:
+            signature = None
+        self._layout_cache[key] = (layout, signature)
+        if len(self._layout_cache) > self._layout_cache_size:
+            self._layout_cache.popitem(last=False)
+        return layout
+
+    def load_screen(self, screen_def, offset=0, version=None):
+        layout = self.compile_screen(screen_def, version)
+        with self._lock:
+            self._load_layout(screen_def, layout, offset)
+        # Send the changes to the screen
+        self._update_display()
 
-    def load_screen(self, screen_def, offset=0):
+    def switch_screen(self, screen_def, offset=0, version=None):
+        # Page switch for going from one menu to the next. Like load_screen, but the display
+        # is never cleared: only the cells that differ between the two screens are written,
+        # so there is no blank frame in between. Prefetched screens are already compiled.
+        layout = self.compile_screen(screen_def, version)
+        with self._lock:
+            self._load_layout(screen_def, layout, offset)
+            self._avoid_clear = True
+        self._update_display()
+
+    def set_next_screens(self, screen_def, next_screens, versions=None):
+        # Tell lcdzilla which screens are likely to follow a screen. They are queued for
+        # prefetching whenever that screen is shown, each with the version it is loaded with
+        # when versions is given.
+        if versions is None:
+            versions = [None] * len(next_screens)
+        self._next_screens[id(screen_def)] = (screen_def, list(zip(next_screens, versions)))
+
+    def prefetch(self, screen_def, offset=0, version=None):
+        # Queue a screen to be compiled ahead of time by run_prefetch. The rows of a lazy
+        # screen prefetched without a version are built from its source when it is
+        # prefetched and used the next time the screen is shown.
+        key = (id(screen_def), version, offset)
+        self._prefetch_queue[key] = (screen_def, offset, version)
+
+    def prefetch_pending(self):
+        return len(self._prefetch_queue) > 0
+
+    def run_prefetch(self, max_screens=None):
+        # Compile queued screens into the layout cache along with the rows that will be
+        # visible, which for a lazy screen means rendering them from its source. Meant to be
+        # called when there is nothing else to do. Returns True if screens are left.
+        done = 0
+        while len(self._prefetch_queue) and (max_screens is None or done < max_screens):
+            screen_def, offset, version = self._prefetch_queue.popitem(last=False)[1]
+            layout = self.compile_screen(screen_def, version)
+            for line_idx in range(offset, min(offset+self._num_lines, layout.num_rows)):
+                layout.row(line_idx)
+            if version is None and is_lazy(screen_def):
+                self._prefetched[id(screen_def)] = layout
+                if len(self._prefetched) > self._layout_cache_size:
+                    self._prefetched.popitem(last=False)
+            done += 1
+        return self.prefetch_pending()
+
+    def _load_layout(self, screen_def, layout, offset):
 
         self._screen_def = screen_def
+        self._layout = layout
+        if id(screen_def) in self._next_screens:
+            for next_screen, version in self._next_screens[id(screen_def)][1]:
+                self.prefetch(next_screen, version=version)
+        self._bound_values = {}
+        self._binding_due = {}
+        self._pushed_values = {}
 
-        # Clear the display
-        self._lcd.clear()
+        # Start from a blank frame. Nothing is sent to the display until the frame
+        # is complete, then only the cells that differ from the shadow are written.
+        self._frame = [" " * self._num_characters for _ in range(self._num_lines)]
         self._char_set_key_label = ""
-        self._first_visible_row = -1
-        self._last_visible_row = -1
+        num_rows = layout.num_rows
+        if offset < num_rows:
+            self._first_visible_row = offset
+            self._last_visible_row = min(offset+self._num_lines, num_rows) - 1
+        else:
+            self._first_visible_row = -1
+            self._last_visible_row = -1
         
         # Hide the cursor
-        self._lcd.set_cursor_mode(CursorMode.HIDE)
+        self._cursor_mode = CURSOR_HIDE
         
-        # Reset cursor row/field
+        # Use the first visible selectable field as the cursor default
         self._cur_row = -1
         self._cur_field = -1
-        # Reset the field that will keep track of the row/columns where the cursor can appear
-        self._cursor_positions = []
+        for line_idx in range(self._first_visible_row, self._last_visible_row+1):
+            selectable_fields = layout.row(line_idx).selectable_fields
+            if len(selectable_fields):
+                self._cur_row = (line_idx-offset)
+                self._cur_field = selectable_fields[0]
+                break
+        self._selectable = self._cur_row >= 0
 
-        # Loop through the array elements.  The outer element defines one line on the lcd.
-        # Each line has one or more array elements which represent subfields of a single line
-        lcd_text = ""
-        self._edit_mode = False
-        self._selectable = False
-        self._edit_numbers = False
+        # Set up the field being edited, if there is one
+        self._edit_mode = layout.edit_item is not None
+        self._edit_numbers = layout.edit_numbers
         self._edit_pos = 0
         self._edit_item = []
+        self._edit_field = None
         self._cur_character_set = None
-        lcd_line = ""
-        for line_idx, line in enumerate(screen_def):
-            if line_idx >= offset:
-                # Set the first visible row
-                if self._first_visible_row < 0:
-                    self._first_visible_row = line_idx
-                lcd_line = ""
-                cursor_positions = []
-                # How many subfields? Should we have a maximum?
-                num_subfields = len(line)
-                # Determine the length of each subfield in the line
-                subfield_len = math.floor(self._num_characters / num_subfields)
-                if subfield_len < self._num_characters:
-                    subfield_len += 1
-                for subfield_idx, subfield in enumerate(line):
-                    # Is this field selectable?
-                    if "select" in subfield and subfield["select"] is True:
-                        self._selectable = True
-                        cursor_positions.append(len(lcd_line))
-                        # Use the first selectable field as the cursor default
-                        if self._cur_row == -1:
-                            self._cur_row = (line_idx-offset)
-                            self._cur_field = subfield_idx
-                    # text element is required
-                    if "text" not in subfield:
-                        raise Exception("'text' element missing from definition")
-                    # this is edit mode?
-                    if "edit" in subfield and subfield["edit"] is True:
-                        self._edit_mode = True
-                        if "type" in subfield:
-                            self._edit_numbers = (subfield["type"] == "number")
-                        else:
-                            self._edit_numbers = False
-                        # Set the initial character set to use
-                        self._set_character_set(subfield["text"], 0)
-                        # Store the line and subfield being edited
-                        self._edit_item = [line_idx, subfield_idx]
-                    # Only write to the LCD if we haven't filled it up yet
-                    if line_idx < (self._num_lines+offset):
-                        self._last_visible_row = line_idx
-                        # Construct the line to write to the LCD
-                        if type(subfield['text']) == int:
-                            text = str(subfield['text'])
-                        else:
-                            text = subfield['text']
-                        lcd_line += ("{0:" + str(subfield_len) + "." + str(subfield_len) + "}").format(text)
-                if line_idx < (self._num_lines+offset):
-                    # The line cannot be longer than the number of characters defined.
-                    lcd_line = ("{0: " + str(self._num_characters) + "." + str(self._num_characters) + "}").format(lcd_line)
-                    lcd_text += lcd_line
-                self._cursor_positions.append(cursor_positions)
-
-        # If a field is selectable but no default throw an error
-        if self._selectable and self._cur_row < 0:
-            raise Exception("Selectable fields in screen definition but no default specified")
-        
+        if self._edit_mode:
+            # Store the line and subfield being edited
+            self._edit_item = list(layout.edit_item)
+            self._edit_field = self._field(self._edit_item[0], self._edit_item[1])
+            # Set the initial character set to use
+            self._set_character_set(self._edit_field.text, 0)
+
+        # Only the visible lines are written to the LCD
+        self._collect_bindings()
+        for line_idx in range(self._first_visible_row, self._last_visible_row+1):
+            self._frame[line_idx-offset] = self._row_text(line_idx)
+
         # If debugging print cursor positions
         if self._debug:
             print(self._cur_row)
             print(self._cur_field)
-            print(self._cursor_positions)
+            print(self._visible_cursor_positions())
             
-        # Send to screen
-        self._lcd.print(lcd_text)
-        
         # Set the status line to switch character sets when not editing a number
-        status_text = ""
         if self._edit_mode:
             if not self._edit_numbers:
-                self.load_status_line(self._char_set_key_label + self._bkspc_key + "=Bkspc", line_number=(self._num_lines-2))
-            self.load_status_line("Ent=Save")
+                self._set_status_line(self._char_set_key_label + self._bkspc_key + "=Bkspc", line_number=(self._num_lines-2))
+            self._set_status_line("Ent=Save")
         
         # If the there is a selectable field then display the cursor.
         if self._selectable:
             if self._debug:
                 print("Setting cursor position: {0}, {1}".format(self._cur_row, self._cur_field))
-            cursor_pos = self._cursor_positions[self._cur_row][self._cur_field]
-            self._lcd.set_cursor_pos(self._cur_row, cursor_pos)
-            self._lcd.set_cursor_mode(CursorMode.BLINK)
+            cursor_pos = self._row_positions(self._cur_row)[self._cur_field]
+            self._cursor = [self._cur_row, cursor_pos]
+            self._cursor_mode = CURSOR_BLINK
+
+    def _field(self, line_idx, field_idx):
+        return self._layout.row(line_idx).fields[field_idx]
+
+    def _row_positions(self, row):
+        # Columns where the cursor can appear on a display row
+        return self._layout.row(self._first_visible_row+row).cursor_positions
+
+    def _visible_cursor_positions(self):
+        return [self._row_positions(row) for row in range(self._last_visible_row-self._first_visible_row+1)]
+
+    def _row_text(self, line_idx):
+        # The compiled text of a line, with the field being edited and any bound fields
+        # re-rendered from their current values
+        row = self._layout.row(line_idx)
+        lcd_line = row.text
+        if self._edit_mode and line_idx == self._edit_item[0]:
+            text = str(self._edit_field.text)
+            lcd_line = self._fit_field(lcd_line, row.field_spans[self._edit_item[1]], text)
+        for subfield_idx in row.bound_fields:
+            key = (line_idx, subfield_idx)
+            if key in self._bound_values:
+                lcd_line = self._fit_field(lcd_line, row.field_spans[subfield_idx], self._bound_values[key])
+        return lcd_line
+
+    def _fit_field(self, lcd_line, field_span, text):
+        # Replace the text of one subfield in a line, padded or cut to the subfield width
+        col, width = field_span
+        return lcd_line[:col] + ("{0:" + str(width) + "." + str(width) + "}").format(text) + lcd_line[col+width:]
+
+    def _collect_bindings(self):
+        # Find the bound fields on the visible rows. Fields that haven't been shown yet are
+        # read straight away so the first frame has real values in it.
+        now = time.monotonic()
+        self._bindings = []
+        for line_idx in range(self._first_visible_row, self._last_visible_row+1):
+            for subfield_idx in self._layout.row(line_idx).bound_fields:
+                key = (line_idx, subfield_idx)
+                self._bindings.append(key)
+                if key not in self._bound_values:
+                    self._read_binding(key, now)
+        # Forget the fields that scrolled out of view
+        for key in list(self._binding_due):
+            if key[0] < self._first_visible_row or key[0] > self._last_visible_row:
+                del self._binding_due[key]
+                self._bound_values.pop(key, None)
+                self._pushed_values.pop(key, None)
+
+    def _read_binding(self, key, now):
+        # Get the latest value of a bound field, either pushed in with update_field or read
+        # from its callable, and return True when the rendered text changed. A field bound
+        # to something that isn't callable only changes through update_field.
+        field = self._field(key[0], key[1])
+        if field.interval is not None:
+            self._binding_due[key] = now + field.interval
+        else:
+            self._binding_due[key] = now + self.BIND_INTERVAL
+        if key in self._pushed_values:
+            value = self._pushed_values.pop(key)
+        elif callable(field.bind):
+            value = field.bind()
+        elif key in self._bound_values:
+            # Keep showing the last value pushed
+            return False
+        else:
+            value = field.text
+        if field.format is not None:
+            text = field.format.format(value)
+        else:
+            text = str(value)
+        if self._bound_values.get(key) == text:
+            return False
+        self._bound_values[key] = text
+        return True
+
+    def update_field(self, line_idx, subfield_idx, value):
+        # Push a new value for a visible bound field. It is shown straight away unless the
+        # field was refreshed less than its interval ago, in which case the latest value
+        # pushed is shown by refresh_bound_fields once the field is due.
+        key = (line_idx, subfield_idx)
+        if key not in self._binding_due:
+            return
+        self._pushed_values[key] = value
+        if time.monotonic() >= self._binding_due[key]:
+            self.refresh_bound_fields()
+
+    def refresh_bound_fields(self):
+        # Read every visible bound field that is due and rewrite the ones whose text changed.
+        # All the changes go to the display in one update and the cursor and edit state are
+        # left alone. Returns the number of fields rewritten.
+        now = time.monotonic()
+        changed = 0
+        with self._lock:
+            for key in self._bindings:
+                if now < self._binding_due[key]:
+                    continue
+                if not self._read_binding(key, now):
+                    continue
+                col, width = self._layout.row(key[0]).field_spans[key[1]]
+                self._write_frame(key[0]-self._first_visible_row, col,
+                                  ("{0:" + str(width) + "." + str(width) + "}").format(self._bound_values[key]))
+                changed += 1
+        if changed:
+            self._update_display()
+        return changed
+
+    def next_refresh_time(self):
+        # The time.monotonic() value when the next bound field is due, or None if there
+        # are no bound fields on screen
+        if not len(self._bindings):
+            return None
+        return min(self._binding_due[key] for key in self._bindings)
+
+    async def run_bound_fields(self):
+        # Keep the bound fields up to date from an asyncio task. asyncio is only imported
+        # when it is used as it takes longer to import than the rest of lcdzilla.
+        import asyncio
+        while True:
+            self.refresh_bound_fields()
+            next_time = self.next_refresh_time()
+            if next_time is None:
+                delay = self.BIND_INTERVAL
+            else:
+                delay = max(0, next_time - time.monotonic())
+            await asyncio.sleep(delay)
+
+    def _scroll(self, direction):
+        # Move the visible window one row up or down. The rows come straight from the
+        # compiled layout and the shadow diff means only the rows whose content changes
+        # are written.
+        with self._lock:
+            first_row = self._first_visible_row + direction
+            self._first_visible_row = first_row
+            self._last_visible_row = min(first_row + self._num_lines, self._layout.num_rows) - 1
+            self._collect_bindings()
+            for line_idx in range(first_row, self._last_visible_row+1):
+                self._frame[line_idx-first_row] = self._row_text(line_idx)
+            for row in range(self._last_visible_row-first_row+1, self._num_lines):
+                self._frame[row] = " " * self._num_characters
+
+            # The cursor stays on the same display row. If that row can't be selected look
+            # for the nearest visible row that can, starting in the direction of the scroll.
+            num_visible = self._last_visible_row - first_row + 1
+            if self._cur_row >= num_visible or not len(self._row_positions(self._cur_row)):
+                if direction == self.SCROLL_DOWN:
+                    search = list(range(self._cur_row, -1, -1)) + list(range(self._cur_row+1, num_visible))
+                else:
+                    search = list(range(self._cur_row, num_visible)) + list(range(self._cur_row-1, -1, -1))
+                for row_idx in search:
+                    if row_idx < num_visible and len(self._row_positions(row_idx)):
+                        self._cur_row = row_idx
+                        break
+            if self._debug:
+                print("Scrolled to row {0}; cursor row: {1}".format(first_row, self._cur_row))
+            positions = self._row_positions(self._cur_row)
+            if len(positions):
+                self._cur_field = min(self._cur_field, len(positions)-1)
+                self._cursor = [self._cur_row, positions[self._cur_field]]
+        self._update_display()
 
     def load_status_line(self, status_text, line_number=None):
+        self._set_status_line(status_text, line_number)
+        self._update_display()
+
+    def _set_status_line(self, status_text, line_number=None):
         
         if self._debug:
             print("Updating status line: {0}".format(status_text))
@@ -201,23 +560,18 @@ class lcdzilla:
         # Make sure the status text doesn't exceed the width of the lcd
         if len(status_text) > self._num_characters:
             status_text = status_text[:self._num_characters]
-        # Position to the line being updated
-        self._lcd.set_cursor_pos(line_number, 0)
-        # Center the text and show
-        self._lcd.print(status_text.center(self._num_characters))
+        # Center the text and place it on the line being updated
+        self._frame[line_number] = status_text.center(self._num_characters)
         
     def cursor_down(self):
         # If we're in edit mode then cursor down will change the character at the cursor to
         # the next element in the array
         if self._edit_mode:
-            # Get the subfield definition being edited
-            edit_subfield = self._screen_def[self._edit_item[0]][self._edit_item[1]]
+            edit_field = self._edit_field
             if self._debug:
-                print("Subfield being edited: {0}".format(edit_subfield))
-            # Get the current cursor position
-            save_cursor = self._lcd.cursor_pos()
+                print("Field being edited: {0}".format(edit_field.text))
             # Get the edit text
-            edit_value = edit_subfield['text']
+            edit_value = edit_field.text
             if self._debug:
                 print("Value being edited: {0}".format(edit_value))
             # Get the character from the text element that we're currently on
@@ -228,252 +582,489 @@ class lcdzilla:
                     cur_char = edit_value[self._edit_pos]
                 if self._debug:
                     print("Finding character {0}".format(cur_char))
-                char_index = self._cur_character_set.find(cur_char)
-                if self._debug:
-                    print("Character index: {0}".format(char_index))
-                if char_index >= 0:
-                    if char_index < (len(self._cur_character_set)-1):
-                        cur_char = self._cur_character_set[char_index+1]
-                    else:
-                        cur_char = self._cur_character_set[0]
-                else:
-                    cur_char = self._cur_character_set[0]
+                cur_char = self._cur_character_set.next_char(cur_char)
                 # Update the character in the edit value with the new value
                 edit_value = edit_value[:self._edit_pos] + cur_char + edit_value[self._edit_pos+1:]
-            # Else for a number just increment by 1 unless it reaches the set maximum value
+            # Else for a number step down unless it reaches the set minimum value
             else:
-                if 'min_value' in edit_subfield:
-                    if (edit_value-1) >= edit_subfield['min_value']:
-                        edit_value -= 1
-                else:
-                    edit_value -= 1
+                edit_value = self._step_number(edit_field, -1)
             # Replace the text with the new value
-            edit_subfield["text"] = edit_value
-            # If editing numbers replace the entire line
+            edit_field.text = edit_value
+            # If editing numbers rewrite the field, otherwise just the character
             if self._edit_numbers:
-                lcd_line = ("{0:" + str(self._num_characters) + "." + str(self._num_characters) + "}").format(str(edit_value))
-                self._lcd.print(lcd_line)
+                self._write_edit_field()
             else:
-                self._lcd.print(cur_char)
-            # Reset the cursor position
-            self._lcd.set_cursor_pos(save_cursor[0], save_cursor[1])
+                self._write_frame(self._cursor[0], self._cursor[1], cur_char)
+            self._update_display()
             if self._debug:
                 print("Cursor position: {0}".format(self._edit_pos))
         else:
             
             # If the new current row is greater than the last visible row and
-            # the last visible row is less than the number of rows then reload
-            # the screen with the appropriate offset
+            # the last visible row is less than the number of rows then scroll
+            # the screen down
             if self._debug:
                 print("Current row: {0}; Last visible row: {1}".format(self._cur_row, self._last_visible_row))
-            if (self._cur_row+1+self._first_visible_row) > self._last_visible_row and (len(self._screen_def)-1) > self._last_visible_row:
-                self.load_screen(self._screen_def, self._first_visible_row+1)
+            if (self._cur_row+1+self._first_visible_row) > self._last_visible_row and (self._layout.num_rows-1) > self._last_visible_row:
+                self._scroll(self.SCROLL_DOWN)
             else:
                 # Is there any line "down" that we can move the cursor to?
-                for row_idx in range(self._cur_row+1, len(self._cursor_positions)):
-                    if len(self._cursor_positions[row_idx]):
+                for row_idx in range(self._cur_row+1, self._last_visible_row-self._first_visible_row+1):
+                    if len(self._row_positions(row_idx)):
                         self._cur_row = row_idx
                         break
                 
-                self._lcd.set_cursor_pos(self._cur_row, self._cursor_positions[self._cur_row][self._cur_field])
+                self._set_cursor(self._cur_row, self._row_positions(self._cur_row)[self._cur_field])
 
     def cursor_up(self):
         if self._edit_mode:
-            # Get the subfield definition being edited
-            edit_subfield = self._screen_def[self._edit_item[0]][self._edit_item[1]]
+            edit_field = self._edit_field
             if self._debug:
-                print("Subfield being edited: {0}".format(edit_subfield))
-            # Get the current cursor position
-            save_cursor = self._lcd.cursor_pos()
+                print("Field being edited: {0}".format(edit_field.text))
             # Get the edit value
-            edit_value = edit_subfield['text']
+            edit_value = edit_field.text
             if not self._edit_numbers:
                 # Get the character from the text element that we're currently on
                 if self._edit_pos > (len(edit_value)-1):
                     cur_char = ""
                 else:
                     cur_char = edit_value[self._edit_pos]
-                char_index = self._cur_character_set.find(cur_char)
-                if char_index > 0:
-                    cur_char = self._cur_character_set[char_index-1]
-                else:
-                    cur_char = self._cur_character_set[-1]
+                cur_char = self._cur_character_set.prev_char(cur_char)
                 # Update the character in the edit value with the new value
                 edit_value = edit_value[:self._edit_pos] + cur_char + edit_value[self._edit_pos+1:]
-            # When updating numbers of there is a min or max value and the new value is outside of that range
-            # then don't update the number
+            # Else for a number step up unless it reaches the set maximum value
             else:
-                if "max_value" in edit_subfield:
-                    if (edit_value+1) <= edit_subfield["max_value"]:
-                        edit_value +=1 
-                else:
-                    edit_value +=1
-            edit_subfield['text'] = edit_value
-            # If editing numbers replace the entire line
+                edit_value = self._step_number(edit_field, 1)
+            edit_field.text = edit_value
+            # If editing numbers rewrite the field, otherwise just the character
             if self._edit_numbers:
-                lcd_line = ("{0:" + str(self._num_characters) + "." + str(self._num_characters) + "}").format(str(edit_value))
-                self._lcd.print(lcd_line)
+                self._write_edit_field()
             else:
-                self._lcd.print(cur_char)
-            # Reset the cursor position
-            self._lcd.set_cursor_pos(save_cursor[0], save_cursor[1])
+                self._write_frame(self._cursor[0], self._cursor[1], cur_char)
+            self._update_display()
         else:
-            # If the new current row is less than the first visible row and
-            # the first visible row is > 0 then reload
-            # the screen with the appropriate offset
-            if (self._cur_row-1) < self._first_visible_row and self._last_visible_row > 0:
-                self.load_screen(self._screen_def, self._first_visible_row-1)
+            # If the cursor is on the top row and the first visible row is > 0
+            # then scroll the screen up
+            if self._cur_row == 0 and self._first_visible_row > 0:
+                self._scroll(self.SCROLL_UP)
             else:
                 # Can we move up?
                 for row_idx in range(self._cur_row-1, -1, -1):
-                    if len(self._cursor_positions[row_idx]):
+                    if len(self._row_positions(row_idx)):
                         self._cur_row = row_idx
                         break
-                self._lcd.set_cursor_pos(self._cur_row, self._cursor_positions[self._cur_row][self._cur_field])
+                self._set_cursor(self._cur_row, self._row_positions(self._cur_row)[self._cur_field])
+
+    def set_number_acceleration(self, repeat_window, presses_per_step, max_exponent=3):
+        # Holding up/down while editing a number multiplies the step by 10 every
+        # presses_per_step presses that arrive within repeat_window seconds of each other, up
+        # to 10 ** max_exponent times the field's step. A presses_per_step of 0 turns
+        # acceleration off, which is the default.
+        self._repeat_window = repeat_window
+        self._presses_per_step = presses_per_step
+        self._max_step_exponent = max_exponent
+
+    def _step_number(self, edit_field, direction):
+        # Work out how big a step to take. Presses in the same direction that come quickly
+        # one after the other count as holding the key.
+        now = time.monotonic()
+        if direction == self._repeat_direction and (now - self._repeat_time) <= self._repeat_window:
+            self._repeat_count += 1
+        else:
+            self._repeat_count = 0
+        self._repeat_direction = direction
+        self._repeat_time = now
+        step = edit_field.step
+        if self._presses_per_step > 0:
+            step *= 10 ** min(self._repeat_count // self._presses_per_step, self._max_step_exponent)
+
+        # A step past the min or max value stops at the limit. A value already outside the
+        # range isn't changed.
+        edit_value = edit_field.text
+        new_value = edit_value + (step * direction)
+        if direction > 0 and edit_field.max_value is not None and new_value > edit_field.max_value:
+            new_value = max(edit_value, edit_field.max_value)
+        if direction < 0 and edit_field.min_value is not None and new_value < edit_field.min_value:
+            new_value = min(edit_value, edit_field.min_value)
+        return new_value
+
+    def _write_edit_field(self):
+        # Rewrite the field being edited in place. The shadow diff means only the characters
+        # that changed are sent.
+        line_idx, subfield_idx = self._edit_item
+        col, width = self._layout.row(line_idx).field_spans[subfield_idx]
+        text = str(self._edit_field.text)
+        self._write_frame(line_idx-self._first_visible_row, col, ("{0:" + str(width) + "." + str(width) + "}").format(text))
 
     def cursor_left(self):
         if self._edit_mode:
             if self._edit_pos > 0 and not self._edit_numbers:
                 self._edit_pos -= 1
-                self._lcd.set_cursor_pos(self._edit_item[0], self._edit_pos)
+                self._set_cursor(self._edit_item[0], self._edit_pos)
         else:
             # Can we move left?
             if self._cur_field > 0:
                 self._cur_field -= 1
-            self._lcd.set_cursor_pos(self._cur_row, self._cursor_positions[self._cur_row][self._cur_field])
+            self._set_cursor(self._cur_row, self._row_positions(self._cur_row)[self._cur_field])
             
     def cursor_right(self):
      
         if self._edit_mode:
             if not self._edit_numbers:
-                # Get the subfield definition being edited
-                edit_subfield = self._screen_def[self._edit_item[0]][self._edit_item[1]]
-                if 'max_len' in edit_subfield:
-                    max_char = edit_subfield['max_len']
+                edit_field = self._edit_field
+                if edit_field.max_len is not None:
+                    max_char = edit_field.max_len
                 else:
                     max_char = self._num_characters
                 if self._edit_pos < (max_char-1):
                     self._edit_pos += 1
-                    self._lcd.set_cursor_pos(self._edit_item[0], self._edit_pos)
+                    self._set_cursor(self._edit_item[0], self._edit_pos)
                 # If the new position is past the end of the text value and we're editing numbers
                 # then append a 0 to the new position
-                if self._edit_pos > (len(str(edit_subfield["text"]))-1) and self._edit_numbers:
-                    new_text = str(edit_subfield["text"])
-                    new_text += self._numbers[0]
-                    edit_subfield["text"] = int(new_text)
+                if self._edit_pos > (len(str(edit_field.text))-1) and self._edit_numbers:
+                    new_text = str(edit_field.text)
+                    new_text += self._character_sets["numbers"].characters[0]
+                    edit_field.text = int(new_text)
                     if self._debug:
-                        print("New edit subfield: {0}".format(edit_subfield))
-                    save_cursor = self._lcd.cursor_pos()
-                    self._lcd.print(self._numbers[0])
-                    self._lcd.set_cursor_pos(save_cursor[0], save_cursor[1])
+                        print("New edit value: {0}".format(edit_field.text))
+                    self._write_frame(self._cursor[0], self._cursor[1], self._character_sets["numbers"].characters[0])
+                    self._update_display()
         else:
             # Can we move right?
-            if self._cur_field < (len(self._cursor_positions[self._cur_row])-1):
+            if self._cur_field < (len(self._row_positions(self._cur_row))-1):
                 self._cur_field += 1
-            self._lcd.set_cursor_pos(self._cur_row, self._cursor_positions[self._cur_row][self._cur_field])
+            self._set_cursor(self._cur_row, self._row_positions(self._cur_row)[self._cur_field])
 
     def enter(self):
-        subfield = self._screen_def[(self._cur_row+self._first_visible_row)][self._cur_field]
-        if "select" in subfield and subfield["select"] is True:
+        field = self._field(self._cur_row+self._first_visible_row, self._cur_field)
+        if field.selectable:
             # In edit mode and entering numbers ensure the value is between the min and max values if specified
             if self._edit_mode and self._edit_numbers:
-                num_value = subfield["text"]
-                save_cursor = self._lcd.cursor_pos()
-                if "min_value" in subfield and num_value < subfield["min_value"]:
-                    self.load_status_line("Value must be >= {0}".format(subfield["min_value"]))
-                    self._lcd.set_cursor_pos(save_cursor[0], save_cursor[1])
+                num_value = field.text
+                if field.min_value is not None and num_value < field.min_value:
+                    self.load_status_line("Value must be >= {0}".format(field.min_value))
                     return None
-                if "max_value" in subfield and num_value > subfield["max_value"]:
-                    self.load_status_line("Value must be <= {0}".format(subfield["max_value"]))
-                    self._lcd.set_cursor_pos(save_cursor[0], save_cursor[1])
+                if field.max_value is not None and num_value > field.max_value:
+                    self.load_status_line("Value must be <= {0}".format(field.max_value))
                     return None            
-            return subfield
+            return field.selected()
 
     # Backspace key. This key only does something in edit mode
     def backspace(self):
         if self._edit_mode:
-            # Get the subfield definition being edited
-            edit_subfield = self._screen_def[self._edit_item[0]][self._edit_item[1]]
+            edit_field = self._edit_field
             if self._debug:
-                print("Subfield being edited: {0}".format(edit_subfield))
+                print("Field being edited: {0}".format(edit_field.text))
             # If there is any text then delete the last one
             if self._edit_numbers:
-                text = str(edit_subfield["text"])
+                text = str(edit_field.text)
             else:
-                text = edit_subfield["text"]
+                text = edit_field.text
             if len(text):
                 text = text[:-1]
             if self._edit_numbers:
-                edit_subfield["text"] = int(text)
+                edit_field.text = int(text)
             else:
-                edit_subfield["text"] = text
-            # Save the current cursor position
-            save_cursor = self._lcd.cursor_pos()
+                edit_field.text = text
             # Clear the last character in the edit field and move back 1 space
-            self._lcd.print(" ")
+            self._write_frame(self._cursor[0], self._cursor[1], " ")
             self._edit_pos -= 1
-            self._lcd.set_cursor_pos(save_cursor[0], self._edit_pos)
+            self._set_cursor(self._cursor[0], self._edit_pos)
                 
             
     # Switch between character sets when in edit/alpha
     def sel_character_set(self):
         if self._edit_mode and not self._edit_numbers:
-            if self._cur_character_set == self._alpha_lower_characters:
-                self._cur_character_set = self._alpha_upper_characters
-                self._char_set_key_label = self._char_set_key + "=Symb "
-            elif self._cur_character_set == self._alpha_upper_characters:
-                self._cur_character_set = self._symbol_characters
-                self._char_set_key_label = self._char_set_key + "=Numb "
-            elif self._cur_character_set == self._symbol_characters:
-                self._cur_character_set = self._numbers
-                self._char_set_key_label = self._char_set_key + "=Lowr "
+            # Move on to the next set in the cycle order
+            character_sets = self._cycle_character_sets()
+            if self._cur_character_set in character_sets:
+                set_index = (character_sets.index(self._cur_character_set) + 1) % len(character_sets)
             else:
-                self._cur_character_set = self._alpha_lower_characters
-                self._char_set_key_label = self._char_set_key + "=Uppr "
+                set_index = 0
+            self._use_character_set(character_sets, set_index)
             if self._debug:
                 print("Setting status text: {0}".format(self._char_set_key_label))
-            # Save the cursor position
-            save_cursor = self._lcd.cursor_pos()
-            self.load_status_line(self._char_set_key_label + self._bkspc_key + "=Bkspc", line_number=(self._num_lines-2))
-            self.load_status_line("Ent=Save")
-            self._lcd.set_cursor_pos(save_cursor[0], save_cursor[1])
+            self._set_status_line(self._char_set_key_label + self._bkspc_key + "=Bkspc", line_number=(self._num_lines-2))
+            self._set_status_line("Ent=Save")
+            self._update_display()
+
+    def _use_character_set(self, character_sets, set_index):
+        # Make a set current and label the key with the set it will switch to next
+        self._cur_character_set = character_sets[set_index]
+        next_set = character_sets[(set_index + 1) % len(character_sets)]
+        self._char_set_key_label = self._char_set_key + "=" + next_set.label + " "
                         
     def _set_character_set(self, edit_text, position):
-        # When editing an alpha type the character set can be upper, lower, symbol or number
+        # When editing an alpha type the character set can be any of the defined sets
         if self._edit_numbers == False:
+            character_sets = self._cycle_character_sets()
             # Get the first character from the text and use that to determine what character set
-            # we should use as the first set
+            # we should use as the first set, defaulting to the first set in the cycle
+            set_index = 0
             if len(edit_text):
                 if self._debug:
                     print("Looking for character {0}".format(edit_text[position]))
-                if self._alpha_lower_characters.find(edit_text[position]) >= 0:
-                    self._cur_character_set = self._alpha_lower_characters
-                    self._char_set_key_label = self._char_set_key + "=Uppr "
-                elif self._alpha_upper_characters.find(edit_text[position]) >= 0:
-                    self._cur_character_set = self._alpha_upper_characters
-                    self._char_set_key_label = self._char_set_key + "=Symb "
-                elif self._symbol_characters.find(edit_text[position]) >= 0:
-                    self._cur_character_set = self._symbol_characters
-                    self._char_set_key_label = self._char_set_key + "=Numb "
-                elif self._numbers.find(edit_text[position]) >= 0:
-                    self._cur_character_set = self._numbers
-                    self._char_set_key_label = self._char_set_key + "=Lowr "
-            if not self._cur_character_set:
-                self._cur_character_set = self._alpha_lower_characters
-                self._char_set_key_label = self._char_set_key + "=Lowr "
+                for idx, character_set in enumerate(character_sets):
+                    if edit_text[position] in character_set:
+                        set_index = idx
+                        break
+            if len(character_sets):
+                self._use_character_set(character_sets, set_index)
         # When editing number type field the character set can only be numbers            
         else:
-            self._cur_character_set = self._numbers
+            self._cur_character_set = self._character_sets.get("numbers")
 
-        if self._debug:
-            print("Current character set: {0}".format(self._cur_character_set))
+        if self._debug and self._cur_character_set is not None:
+            print("Current character set: {0}".format(self._cur_character_set.name))
             
+    def _set_cursor(self, row, col):
+        self._cursor = [row, col]
+        self._update_display()
+
+    def _write_frame(self, row, col, text):
+        # Place text in the frame at the row/column, clipped to the width of the display
+        line = self._frame[row]
+        text = text[:self._num_characters - col]
+        self._frame[row] = line[:col] + text + line[col+len(text):]
+
+    def _line_runs(self, old_line, new_line):
+        # Find the runs of characters that differ between two lines. An unchanged gap that
+        # costs no more to rewrite than to skip with a cursor move is merged into the run.
+        runs = []
+        start = -1
+        end = -1
+        for col in range(len(new_line)):
+            if old_line is not None and old_line[col] == new_line[col]:
+                continue
+            if start >= 0 and (col - end) <= self.CURSOR_MOVE_COST:
+                end = col + 1
+            else:
+                if start >= 0:
+                    runs.append([start, new_line[start:end]])
+                start = col
+                end = col + 1
+        if start >= 0:
+            runs.append([start, new_line[start:end]])
+        return runs
+
+    def set_background_writer(self, enabled):
+        # In background mode the public methods only update the frame and a writer thread
+        # brings the display up to date. Changes made while the writer is busy are merged
+        # into the frame, so only the latest content of each cell is sent.
+        if enabled and self._writer is None:
+            self._writer_stop = False
+            self._writer_error = None
+            self._writer = threading.Thread(target=self._writer_loop, name="lcdzilla-writer", daemon=True)
+            self._writer.start()
+        elif not enabled and self._writer is not None:
+            with self._writer_condition:
+                self._writer_stop = True
+                self._writer_condition.notify_all()
+            self._writer.join()
+            self._writer = None
+
+    def flush(self, timeout=None):
+        # Wait until everything changed so far is on the display. Returns False if the
+        # timeout expired first.
+        if self._writer is None:
+            return True
+        with self._writer_condition:
+            generation = self._frame_generation
+            flushed = self._writer_condition.wait_for(
+                lambda: self._synced_generation >= generation or self._writer_error is not None, timeout)
+            if self._writer_error is not None:
+                raise Exception("Error writing to LCD: {0}".format(self._writer_error))
+        return flushed
+
+    async def drain(self):
+        # asyncio version of flush
+        import asyncio
+        await asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+    def _writer_loop(self):
+        while True:
+            with self._writer_condition:
+                while self._synced_generation >= self._frame_generation and not self._writer_stop:
+                    self._writer_condition.wait()
+                if self._synced_generation >= self._frame_generation:
+                    return
+                generation = self._frame_generation
+            try:
+                self.sync_display()
+            except Exception as e:
+                with self._writer_condition:
+                    self._writer_error = e
+                    self._writer_condition.notify_all()
+                return
+            with self._writer_condition:
+                self._synced_generation = generation
+                self._writer_condition.notify_all()
+
+    def set_display_manager(self, manager):
+        # A display that shares its bus with others leaves the writing to a DisplayManager,
+        # which calls sync_display when it is this display's turn
+        self._manager = manager
+
+    def set_glyph_registry(self, registry):
+        # Use the custom glyphs in a GlyphRegistry. The registry can be shared by displays.
+        self._glyphs = registry
+        self._glyph_lru = OrderedDict()
+        self._glyph_table = {}
+
+    def _load_glyphs(self, frame):
+        # Make sure every glyph in the frame is in a CGRAM slot. Glyphs already resident are
+        # left where they are, so a bitmap is only uploaded when it isn't loaded yet. When all
+        # the slots are taken the least recently used glyph that isn't in the frame gives up
+        # its slot. If every resident glyph is in the frame the new one is shown as the
+        # fallback character.
+        needed = self._glyphs.glyphs_in("".join(frame))
+        for char in sorted(needed):
+            if char in self._glyph_lru:
+                self._glyph_lru.move_to_end(char)
+                continue
+            if len(self._glyph_lru) < self.CGRAM_SLOTS:
+                slot = len(self._glyph_lru)
+            else:
+                slot = None
+                for old_char in self._glyph_lru:
+                    if old_char not in needed:
+                        slot = self._glyph_lru.pop(old_char)
+                        self._invalidate_glyph(old_char)
+                        break
+            if slot is None:
+                self._glyph_table[ord(char)] = self._glyphs.fallback
+                continue
+            if self._debug:
+                print("Loading glyph {0:x} into slot {1}".format(ord(char), slot))
+            self._lcd.create_char(slot, self._glyphs.bitmap(char))
+            self._shadow_cursor = None
+            # Cells that showed this glyph as the fallback have to be rewritten
+            self._invalidate_glyph(char)
+            self._glyph_lru[char] = slot
+            self._glyph_table[ord(char)] = slot
+
+    def _invalidate_glyph(self, char):
+        # The cells showing a glyph no longer match the shadow, so mark them with a character
+        # that never appears in a frame and the next diff rewrites them
+        self._glyph_table.pop(ord(char), None)
+        for row, line in enumerate(self._shadow):
+            if line is not None and char in line:
+                self._shadow[row] = line.replace(char, "\uffff")
+
+    @contextlib.contextmanager
+    def batch(self):
+        # Apply several changes, such as a burst of key presses, and bring the display up to
+        # date once at the end instead of after every change
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and self._batch_changed:
+                self._batch_changed = False
+                self._update_display()
+
+    def _update_display(self):
+        # Bring the display up to date now, or hand the work to the display manager or the
+        # background writer
+        if self._batch_depth:
+            self._batch_changed = True
+        elif self._manager is not None:
+            self._manager.display_changed(self)
+        elif self._writer is None:
+            self.sync_display()
+        else:
+            with self._writer_condition:
+                self._frame_generation += 1
+                self._writer_condition.notify_all()
+
+    def sync_display(self, max_runs=None):
+        # Send the changes between the frame and the shadow to the display. When max_runs is
+        # given at most that many runs are sent and True is returned if there are more left.
+
+        # Take a consistent copy of the frame and cursor to work from. The no clear request of
+        # a page switch goes with the frame it was made for, so a switch made while this frame
+        # is being written sets it again for the next sync.
+        with self._lock:
+            frame = list(self._frame)
+            cursor = list(self._cursor)
+            cursor_mode = self._cursor_mode
+            avoid_clear = self._avoid_clear
+            self._avoid_clear = False
+
+        if self._glyphs is not None:
+            self._load_glyphs(frame)
+
+        # Work out what it costs to bring the display up to date by rewriting the changed
+        # runs against the shadow
+        runs = []
+        diff_cost = 0
+        for row, line in enumerate(frame):
+            for col, text in self._line_runs(self._shadow[row], line):
+                runs.append([row, col, text])
+                diff_cost += self.CURSOR_MOVE_COST + len(text)
+
+        # If the diff is expensive see whether clearing the display and only writing the
+        # non blank runs is cheaper
+        if diff_cost > self.CLEAR_COST and not avoid_clear:
+            blank_line = " " * self._num_characters
+            clear_runs = []
+            clear_cost = self.CLEAR_COST
+            for row, line in enumerate(frame):
+                for col, text in self._line_runs(blank_line, line):
+                    clear_runs.append([row, col, text])
+                    clear_cost += self.CURSOR_MOVE_COST + len(text)
+            if clear_cost < diff_cost:
+                if self._debug:
+                    print("Clearing display: clear cost {0}, diff cost {1}".format(clear_cost, diff_cost))
+                self._lcd.clear()
+                self._shadow = [blank_line] * self._num_lines
+                self._shadow_cursor = [0, 0]
+                runs = clear_runs
+
+        # Write the runs, only moving the cursor when it isn't already in place
+        if max_runs is not None and len(runs) > max_runs:
+            remaining = True
+            runs = runs[:max_runs]
+        else:
+            remaining = False
+        for row, col, text in runs:
+            if self._shadow_cursor != [row, col]:
+                self._lcd.set_cursor_pos(row, col)
+            if self._glyph_table:
+                self._lcd.print(text.translate(self._glyph_table))
+            else:
+                self._lcd.print(text)
+            self._shadow_cursor = [row, col + len(text)]
+            old_line = self._shadow[row]
+            if old_line is None:
+                # Unknown rows are always sent whole
+                self._shadow[row] = text
+            else:
+                self._shadow[row] = old_line[:col] + text + old_line[col+len(text):]
+
+        # Put the cursor back where it belongs once everything has been written
+        if remaining:
+            # The rest of this frame still mustn't be written with a clear
+            if avoid_clear:
+                with self._lock:
+                    self._avoid_clear = True
+        else:
+            if cursor_mode != CURSOR_HIDE and self._shadow_cursor != cursor:
+                self._lcd.set_cursor_pos(cursor[0], cursor[1])
+                self._shadow_cursor = cursor
+            if self._shadow_cursor_mode != cursor_mode:
+                self._lcd.set_cursor_mode(cursor_mode)
+                self._shadow_cursor_mode = cursor_mode
+        self._lcd.flush()
+        return remaining
+
     def print_debug(self):
 
-        print(self._cursor_positions)
+        print(self._visible_cursor_positions())
         print("Cursor row: {0}".format(self._cur_row))
         print("Cursor field: {0}".format(self._cur_field))
 
         # Print cursor text
         if self._cur_row >= 0:
-            print("Cursor: {0}".format(self._screen_def[self._cur_row][self._cur_field]["text"]))
\ No newline at end of file
+            print("Cursor: {0}".format(self._field(self._first_visible_row+self._cur_row, self._cur_field).text))
\ No newline at end of file
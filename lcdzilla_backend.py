@@ -0,0 +1,309 @@
+import time
+
+# Cursor modes understood by every backend
+CURSOR_HIDE = 0
+CURSOR_LINE = 1
+CURSOR_BLINK = 2
+
+
+class DisplayBackend:
+
+    # The operations lcdzilla needs from a character display. Rows and columns are zero
+    # based and print never has to wrap past the end of a row.
+
+    # True for backends that leave the display blank, with the cursor hidden at the home
+    # position, when they are created, so lcdzilla doesn't have to clear it again
+    starts_blank = False
+
+    def __init__(self, num_lines, num_characters):
+        self.num_lines = num_lines
+        self.num_characters = num_characters
+
+    def clear(self):
+        raise NotImplementedError
+
+    def set_cursor_pos(self, row, col):
+        raise NotImplementedError
+
+    def set_cursor_mode(self, mode):
+        raise NotImplementedError
+
+    def print(self, text):
+        raise NotImplementedError
+
+    def create_char(self, slot, bitmap):
+        # Load a 5x8 bitmap into one of the 8 CGRAM slots. The cursor position is undefined
+        # afterwards.
+        raise NotImplementedError
+
+    def flush(self):
+        # Backends that batch their writes send anything still pending
+        pass
+
+
+class LCDBackend(DisplayBackend):
+
+    # Hardware backend built on the lcd package. The hardware modules are only imported when
+    # this backend is created so lcdzilla can be used on machines without them.
+    def __init__(self, addr, scl_pin, sda_pin, num_lines=4, num_characters=20):
+        super().__init__(num_lines, num_characters)
+        import busio
+        from lcd.lcd import LCD, CursorMode
+        from lcd.i2c_pcf8574_interface import I2CPCF8574Interface
+
+        self._cursor_modes = {
+            CURSOR_HIDE: CursorMode.HIDE,
+            CURSOR_LINE: CursorMode.LINE,
+            CURSOR_BLINK: CursorMode.BLINK,
+        }
+        self._i2c = busio.I2C(scl_pin, sda_pin)
+        self._lcd = LCD(I2CPCF8574Interface(self._i2c, addr), num_rows=num_lines, num_cols=num_characters)
+
+    def clear(self):
+        self._lcd.clear()
+
+    def set_cursor_pos(self, row, col):
+        self._lcd.set_cursor_pos(row, col)
+
+    def set_cursor_mode(self, mode):
+        self._lcd.set_cursor_mode(self._cursor_modes[mode])
+
+    def print(self, text):
+        self._lcd.print(text)
+
+    def create_char(self, slot, bitmap):
+        self._lcd.create_char(slot, bitmap)
+
+
+class PCF8574Backend(DisplayBackend):
+
+    # Drives a HD44780 in 4 bit mode through a PCF8574 backpack. Each byte goes to the
+    # controller as two nibbles, and each nibble is two expander writes: data with enable
+    # high, then data with enable low. Rather than one I2C transaction per write, the writes
+    # are packed into a preallocated buffer and sent with a single writeto when the buffer
+    # fills up or lcdzilla flushes at the end of an update, so a full screen refresh only
+    # takes a few transactions.
+    RS = 0x01
+    ENABLE = 0x04
+    BACKLIGHT = 0x08
+    BYTES_PER_LCD_BYTE = 4
+    # HD44780 commands
+    CLEAR_DISPLAY = 0x01
+    ENTRY_MODE_INCREMENT = 0x06
+    DISPLAY_CONTROL = 0x08
+    DISPLAY_ON = 0x04
+    CURSOR_ON = 0x02
+    BLINK_ON = 0x01
+    FUNCTION_SET_4BIT_2LINE = 0x28
+    SET_CGRAM_ADDR = 0x40
+    SET_DDRAM_ADDR = 0x80
+    # The power on sequence ends with a clear
+    starts_blank = True
+
+    def __init__(self, addr, scl_pin=None, sda_pin=None, num_lines=4, num_characters=20, i2c=None):
+        super().__init__(num_lines, num_characters)
+        if i2c is None:
+            import busio
+            i2c = busio.I2C(scl_pin, sda_pin)
+        self._i2c = i2c
+        self._addr = addr
+        self._backlight = self.BACKLIGHT
+        self._row_offsets = [0x00, 0x40, num_characters, 0x40 + num_characters]
+        self._cursor_controls = {
+            CURSOR_HIDE: self.DISPLAY_ON,
+            CURSOR_LINE: self.DISPLAY_ON | self.CURSOR_ON,
+            CURSOR_BLINK: self.DISPLAY_ON | self.BLINK_ON,
+        }
+        # Room for a whole screen of data plus a cursor move per row
+        self._buffer = bytearray(self.BYTES_PER_LCD_BYTE * num_lines * (num_characters + 1))
+        self._length = 0
+        self._init_display()
+
+    def _init_display(self):
+        # Power on sequence from the datasheet to get the controller into 4 bit mode
+        time.sleep(0.05)
+        for delay in (0.0045, 0.0045, 0.00015):
+            self._put_nibble(0x30, 0)
+            self.flush()
+            time.sleep(delay)
+        self._put_nibble(0x20, 0)
+        self._put_byte(self.FUNCTION_SET_4BIT_2LINE, 0)
+        self._put_byte(self.DISPLAY_CONTROL | self.DISPLAY_ON, 0)
+        self._put_byte(self.ENTRY_MODE_INCREMENT, 0)
+        self.clear()
+
+    def _put_nibble(self, nibble, mode):
+        value = (nibble & 0xF0) | mode | self._backlight
+        self._buffer[self._length] = value | self.ENABLE
+        self._buffer[self._length+1] = value
+        self._length += 2
+
+    def _put_byte(self, value, mode):
+        if self._length + self.BYTES_PER_LCD_BYTE > len(self._buffer):
+            self.flush()
+        self._put_nibble(value, mode)
+        self._put_nibble(value << 4, mode)
+
+    def flush(self):
+        if not self._length:
+            return
+        while not self._i2c.try_lock():
+            pass
+        try:
+            self._i2c.writeto(self._addr, self._buffer, end=self._length)
+        finally:
+            self._i2c.unlock()
+        self._length = 0
+
+    def clear(self):
+        # Clearing is slow so it goes on its own and waits for the controller
+        self._put_byte(self.CLEAR_DISPLAY, 0)
+        self.flush()
+        time.sleep(0.002)
+
+    def set_cursor_pos(self, row, col):
+        self._put_byte(self.SET_DDRAM_ADDR | (self._row_offsets[row] + col), 0)
+
+    def set_cursor_mode(self, mode):
+        self._put_byte(self.DISPLAY_CONTROL | self._cursor_controls[mode], 0)
+
+    def set_backlight(self, on):
+        self.flush()
+        if on:
+            self._backlight = self.BACKLIGHT
+        else:
+            self._backlight = 0
+        # Write the expander pins once with the new backlight state
+        self._buffer[0] = self._backlight
+        self._length = 1
+        self.flush()
+
+    def print(self, text):
+        for char in text:
+            self._put_byte(ord(char) & 0xFF, self.RS)
+
+    def create_char(self, slot, bitmap):
+        self._put_byte(self.SET_CGRAM_ADDR | ((slot & 0x07) << 3), 0)
+        for row in bitmap:
+            self._put_byte(row & 0x1F, self.RS)
+
+
+class SimulatedBackend(DisplayBackend):
+
+    # A pure Python HD44780 that keeps the characters on the screen and the cursor state, and
+    # counts the traffic it would have caused on a PCF8574 backpack. By default it models the
+    # lcd package, where each byte sent to the controller goes as two nibbles and each nibble
+    # takes three I2C writes (data, enable high, enable low) of an address byte plus a data
+    # byte. With batched set it models PCF8574Backend, where each nibble is two expander
+    # bytes and everything up to a flush goes in one transaction.
+    I2C_BYTES_PER_LCD_BYTE = 12
+    I2C_TRANSACTIONS_PER_LCD_BYTE = 6
+    BATCHED_I2C_BYTES_PER_LCD_BYTE = 4
+    # Execution times in seconds from the HD44780 datasheet
+    EXEC_TIME = 0.000037
+    CLEAR_EXEC_TIME = 0.00152
+    starts_blank = True
+
+    def __init__(self, num_lines=4, num_characters=20, i2c_frequency=100000, batched=False):
+        super().__init__(num_lines, num_characters)
+        self.i2c_frequency = i2c_frequency
+        self.batched = batched
+        self._screen = [[" "] * num_characters for _ in range(num_lines)]
+        self._cursor = [0, 0]
+        self._cursor_mode = CURSOR_HIDE
+        self._cgram = [None] * 8
+        self.reset_stats()
+
+    def reset_stats(self):
+        self._commands = 0
+        self._data_bytes = 0
+        self._i2c_bytes = 0
+        self._i2c_transactions = 0
+        self._bus_time = 0.0
+        self._operations = {}
+        self._pending = False
+
+    def stats(self):
+        return {
+            "commands": self._commands,
+            "data_bytes": self._data_bytes,
+            "i2c_bytes": self._i2c_bytes,
+            "i2c_transactions": self._i2c_transactions,
+            "bus_time": self._bus_time,
+            "operations": {operation: dict(totals) for operation, totals in self._operations.items()},
+        }
+
+    def _count(self, operation, commands, data_bytes, exec_time):
+        lcd_bytes = commands + data_bytes
+        if self.batched:
+            # The address byte is counted when the transaction is flushed
+            i2c_bytes = lcd_bytes * self.BATCHED_I2C_BYTES_PER_LCD_BYTE
+            self._pending = True
+        else:
+            i2c_bytes = lcd_bytes * self.I2C_BYTES_PER_LCD_BYTE
+            self._i2c_transactions += lcd_bytes * self.I2C_TRANSACTIONS_PER_LCD_BYTE
+        # Nine clock cycles per byte on the bus including the acknowledge bit
+        bus_time = (i2c_bytes * 9) / self.i2c_frequency + exec_time
+        self._commands += commands
+        self._data_bytes += data_bytes
+        self._i2c_bytes += i2c_bytes
+        self._bus_time += bus_time
+        # Keep a breakdown by operation
+        if operation not in self._operations:
+            self._operations[operation] = {"count": 0, "commands": 0, "data_bytes": 0, "i2c_bytes": 0,
+                                           "bus_time": 0.0}
+        totals = self._operations[operation]
+        totals["count"] += 1
+        totals["commands"] += commands
+        totals["data_bytes"] += data_bytes
+        totals["i2c_bytes"] += i2c_bytes
+        totals["bus_time"] += bus_time
+
+    def flush(self):
+        if self._pending:
+            self._pending = False
+            self._i2c_transactions += 1
+            self._i2c_bytes += 1
+            self._bus_time += 9 / self.i2c_frequency
+
+    def clear(self):
+        self._screen = [[" "] * self.num_characters for _ in range(self.num_lines)]
+        self._cursor = [0, 0]
+        self._count("clear", 1, 0, self.CLEAR_EXEC_TIME)
+        # A batched backend sends a clear on its own
+        if self.batched:
+            self.flush()
+
+    def set_cursor_pos(self, row, col):
+        self._cursor = [row, col]
+        self._count("set_cursor_pos", 1, 0, self.EXEC_TIME)
+
+    def set_cursor_mode(self, mode):
+        self._cursor_mode = mode
+        self._count("set_cursor_mode", 1, 0, self.EXEC_TIME)
+
+    def print(self, text):
+        row, col = self._cursor
+        for char in text:
+            # Characters past the end of the row land in display memory that isn't shown
+            if col < self.num_characters:
+                self._screen[row][col] = char
+            col += 1
+        self._cursor = [row, col]
+        self._count("print", 0, len(text), self.EXEC_TIME * len(text))
+
+    def create_char(self, slot, bitmap):
+        self._cgram[slot] = tuple(bitmap)
+        self._count("create_char", 1, len(bitmap), self.EXEC_TIME * (len(bitmap) + 1))
+
+    def text(self):
+        return ["".join(line) for line in self._screen]
+
+    def cgram(self, slot):
+        return self._cgram[slot]
+
+    def cursor_pos(self):
+        return list(self._cursor)
+
+    def cursor_mode(self):
+        return self._cursor_mode
@@ -0,0 +1,51 @@
+class CharacterSet:
+
+    # A named set of characters to cycle through while editing text. The lookup tables are
+    # built once so finding a character and its neighbours doesn't have to search the set.
+    # When a character appears more than once its first position is used.
+    __slots__ = ("name", "characters", "label", "_index", "_next", "_prev")
+
+    def __init__(self, name, characters, label=None):
+        if not len(characters):
+            raise Exception("Character set '{0}' has no characters".format(name))
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "characters", characters)
+        # Short text shown on the status line for this set
+        if label is None:
+            label = name[:4].capitalize()
+        object.__setattr__(self, "label", label)
+        index = {}
+        next_chars = {}
+        prev_chars = {}
+        for char_index, char in enumerate(characters):
+            if char in index:
+                continue
+            index[char] = char_index
+            next_chars[char] = characters[(char_index+1) % len(characters)]
+            prev_chars[char] = characters[char_index-1]
+        object.__setattr__(self, "_index", index)
+        object.__setattr__(self, "_next", next_chars)
+        object.__setattr__(self, "_prev", prev_chars)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CharacterSet is immutable")
+
+    def __contains__(self, char):
+        return char in self._index
+
+    def __len__(self):
+        return len(self.characters)
+
+    def index(self, char):
+        # Position of the character in the set or -1
+        return self._index.get(char, -1)
+
+    def next_char(self, char):
+        # The character after this one, wrapping round. A character that isn't in the set
+        # moves to the first one.
+        return self._next.get(char, self.characters[0])
+
+    def prev_char(self, char):
+        # The character before this one, wrapping round. A character that isn't in the set
+        # moves to the last one.
+        return self._prev.get(char, self.characters[-1])
@@ -0,0 +1,285 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import struct
+import sys
+from lcdzilla import lcdzilla
+from lcdzilla_input import InputDispatcher
+
+# A daemon that owns one display and lets other processes use it over a Unix socket, so they
+# don't each open the bus and redraw the whole screen. Every message is a frame made of a
+# one byte opcode and a four byte big endian payload length followed by the payload as
+# compact UTF-8 JSON.
+
+DEFAULT_SOCKET = "/tmp/lcdzilla.sock"
+FRAME_HEADER = struct.Struct(">BI")
+MAX_PAYLOAD = 1 << 20
+
+# Client to daemon
+OP_LOAD_SCREEN = 1
+OP_UPDATE_FIELD = 2
+OP_STATUS_LINE = 3
+OP_KEY = 4
+OP_SUBSCRIBE = 5
+# A list of [opcode, payload] messages applied together with a single redraw
+OP_BATCH = 6
+# Daemon to client
+OP_EVENT = 16
+OP_ERROR = 17
+
+
+def encode_frame(opcode, payload):
+    # Anything JSON can't encode, such as a bound callable in a selected subfield, is sent
+    # as its string form
+    data = json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
+    return FRAME_HEADER.pack(opcode, len(data)) + data
+
+
+class DisplayDaemon:
+
+    # Serves a display to the clients connected to the socket. Screens pushed by a client are
+    # plain screen definitions; a subfield with a "bind" value is updated with update_field.
+    # Key presses come from the input sources given here or from the clients, and every
+    # subscribed client is sent an event with the key and, for enter, the selected subfield.
+    def __init__(self, display, path=DEFAULT_SOCKET, sources=(), **dispatcher_options):
+        self._display = display
+        self._path = path
+        self._dispatcher = InputDispatcher(display, on_key=self._key_pressed, **dispatcher_options)
+        self._sources = list(sources)
+        for source in self._sources:
+            self._dispatcher.add_source(source)
+        self._subscribers = set()
+        # Events raised while a frame is being applied wait here until the display is up
+        # to date
+        self._held_events = None
+        self._server = None
+        self._input_task = None
+        self._bind_task = None
+
+    async def start(self):
+        self._remove_stale_socket()
+        self._server = await asyncio.start_unix_server(self._serve_client, path=self._path)
+        if len(self._sources):
+            self._input_task = asyncio.ensure_future(self._dispatcher.run())
+        # Values pushed with update_field before a field is due are shown by this task
+        self._bind_task = asyncio.ensure_future(self._display.run_bound_fields())
+
+    def _remove_stale_socket(self):
+        # A socket file left behind by a daemon that didn't shut down cleanly is replaced, but
+        # one that a running daemon still answers on is left alone
+        if not os.path.exists(self._path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self._path)
+        except ConnectionRefusedError:
+            os.unlink(self._path)
+            return
+        finally:
+            probe.close()
+        raise Exception("Another display daemon is already using {0}".format(self._path))
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        if self._bind_task is not None:
+            self._bind_task.cancel()
+            try:
+                await self._bind_task
+            except asyncio.CancelledError:
+                pass
+            self._bind_task = None
+        if self._input_task is not None:
+            self._dispatcher.stop()
+            await self._input_task
+            self._input_task = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            if os.path.exists(self._path):
+                os.unlink(self._path)
+
+    async def _serve_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(FRAME_HEADER.size)
+                    opcode, length = FRAME_HEADER.unpack(header)
+                    if length > MAX_PAYLOAD:
+                        writer.write(encode_frame(OP_ERROR, {"error": "Frame too large"}))
+                        return
+                    data = await reader.readexactly(length)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                self._held_events = []
+                try:
+                    payload = json.loads(data.decode("utf-8"))
+                    # Everything in the frame, including the key presses it queues, is
+                    # applied before the display is brought up to date
+                    with self._display.batch():
+                        if opcode == OP_BATCH:
+                            for message_opcode, message_payload in payload:
+                                self._apply(message_opcode, message_payload, writer)
+                        else:
+                            self._apply(opcode, payload, writer)
+                        self._dispatcher.dispatch()
+                except Exception as e:
+                    writer.write(encode_frame(OP_ERROR, {"error": str(e)}))
+                finally:
+                    events = self._held_events
+                    self._held_events = None
+                    for frame in events:
+                        self._send_event(frame)
+        finally:
+            self._subscribers.discard(writer)
+            writer.close()
+
+    def _apply(self, opcode, payload, writer):
+        if opcode == OP_LOAD_SCREEN:
+            self._display.load_screen(payload["screen"], payload.get("offset", 0))
+        elif opcode == OP_UPDATE_FIELD:
+            self._display.update_field(payload["line"], payload["field"], payload["value"])
+        elif opcode == OP_STATUS_LINE:
+            self._display.load_status_line(payload["text"], payload.get("line"))
+        elif opcode == OP_KEY:
+            self._dispatcher.post(payload["key"])
+        elif opcode == OP_SUBSCRIBE:
+            self._subscribers.add(writer)
+        else:
+            raise Exception("Unknown opcode: {0}".format(opcode))
+
+    def _key_pressed(self, key, result):
+        if not len(self._subscribers):
+            return
+        if key != "enter":
+            result = None
+        frame = encode_frame(OP_EVENT, {"key": key, "selected": result})
+        if self._held_events is not None:
+            self._held_events.append(frame)
+        else:
+            self._send_event(frame)
+
+    def _send_event(self, frame):
+        for writer in list(self._subscribers):
+            writer.write(frame)
+
+
+class DisplayClient:
+
+    # Talks to a DisplayDaemon. Requests are sent without waiting for a reply; an error the
+    # daemon reports is raised by the next read_event.
+    def __init__(self, path=DEFAULT_SOCKET):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(path)
+        self._batch = None
+        self._buffer = b""
+
+    def close(self):
+        self._socket.close()
+
+    @contextlib.contextmanager
+    def batch(self):
+        # Send everything done inside the block as one frame, which the daemon applies with
+        # a single redraw
+        if self._batch is not None:
+            yield self
+            return
+        self._batch = []
+        try:
+            yield self
+            messages = self._batch
+        finally:
+            self._batch = None
+        if len(messages):
+            self._socket.sendall(encode_frame(OP_BATCH, messages))
+
+    def load_screen(self, screen_def, offset=0):
+        self._send(OP_LOAD_SCREEN, {"screen": screen_def, "offset": offset})
+
+    def update_field(self, line_idx, subfield_idx, value):
+        self._send(OP_UPDATE_FIELD, {"line": line_idx, "field": subfield_idx, "value": value})
+
+    def load_status_line(self, status_text, line_number=None):
+        self._send(OP_STATUS_LINE, {"text": status_text, "line": line_number})
+
+    def press(self, key):
+        self._send(OP_KEY, {"key": key})
+
+    def subscribe(self):
+        # Ask for key events, read with read_event
+        self._send(OP_SUBSCRIBE, {})
+
+    def read_event(self, timeout=None):
+        # Wait for the next key event, a dict with the key and the selected subfield. Returns
+        # None if the timeout expires first.
+        self._socket.settimeout(timeout)
+        try:
+            while True:
+                frame = self._next_frame()
+                if frame is not None:
+                    opcode, payload = frame
+                    if opcode == OP_ERROR:
+                        raise Exception("Display daemon error: {0}".format(payload["error"]))
+                    return payload
+                data = self._socket.recv(4096)
+                if not len(data):
+                    raise Exception("Display daemon closed the connection")
+                self._buffer += data
+        except socket.timeout:
+            return None
+        finally:
+            self._socket.settimeout(None)
+
+    def _send(self, opcode, payload):
+        if self._batch is not None:
+            self._batch.append([opcode, payload])
+        else:
+            self._socket.sendall(encode_frame(opcode, payload))
+
+    def _next_frame(self):
+        if len(self._buffer) < FRAME_HEADER.size:
+            return None
+        opcode, length = FRAME_HEADER.unpack_from(self._buffer)
+        end = FRAME_HEADER.size + length
+        if len(self._buffer) < end:
+            return None
+        payload = json.loads(self._buffer[FRAME_HEADER.size:end].decode("utf-8"))
+        self._buffer = self._buffer[end:]
+        return opcode, payload
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Share an lcdzilla display between processes")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="path of the Unix socket to listen on")
+    parser.add_argument("--addr", type=lambda value: int(value, 0), default=0x27, help="I2C address of the PCF8574")
+    parser.add_argument("--lines", type=int, default=4, help="number of lines on the display")
+    parser.add_argument("--characters", type=int, default=20, help="number of characters per line")
+    parser.add_argument("--simulated", action="store_true", help="use a simulated display")
+    args = parser.parse_args(argv)
+
+    if args.simulated:
+        display = lcdzilla(lcdzilla.LCD_SIMULATED, None, None, None, num_lines=args.lines,
+                           num_characters=args.characters)
+    else:
+        import board
+        display = lcdzilla(lcdzilla.LCD_PFC8574, args.addr, board.SCL, board.SDA, num_lines=args.lines,
+                           num_characters=args.characters)
+    daemon = DisplayDaemon(display, args.socket)
+    try:
+        asyncio.run(daemon.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
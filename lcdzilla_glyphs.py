@@ -0,0 +1,41 @@
+class GlyphRegistry:
+
+    # Custom 5x8 glyphs by name. Every glyph is given a character from the Unicode private use
+    # area which can be put in screen definition text like any other character, for example
+    # "Vol " + glyphs.char("bar3"). lcdzilla loads the glyphs into the display's CGRAM slots
+    # as they are needed. Glyphs that can't get a slot are shown as the fallback character.
+    GLYPH_BASE = 0xE000
+
+    def __init__(self, fallback="?"):
+        self.fallback = fallback
+        self._names = {}
+        self._bitmaps = {}
+        self._chars = set()
+
+    def register(self, name, bitmap):
+        # bitmap is 8 rows of 5 bits, top row first
+        if name in self._names:
+            raise Exception("Glyph '{0}' is already registered".format(name))
+        if len(bitmap) != 8:
+            raise Exception("Glyph '{0}' must have 8 rows".format(name))
+        char = chr(self.GLYPH_BASE + len(self._names))
+        self._names[name] = char
+        self._bitmaps[char] = tuple(row & 0x1F for row in bitmap)
+        self._chars.add(char)
+        return char
+
+    def char(self, name):
+        return self._names[name]
+
+    def __getitem__(self, name):
+        return self._names[name]
+
+    def __contains__(self, char):
+        return char in self._bitmaps
+
+    def bitmap(self, char):
+        return self._bitmaps[char]
+
+    def glyphs_in(self, text):
+        # The glyph characters used in a piece of text
+        return self._chars.intersection(text)
@@ -0,0 +1,173 @@
+import asyncio
+import time
+
+# Key names and the lcdzilla method each one calls
+KEY_ACTIONS = {
+    "up": "cursor_up",
+    "down": "cursor_down",
+    "left": "cursor_left",
+    "right": "cursor_right",
+    "enter": "enter",
+    "backspace": "backspace",
+    "charset": "sel_character_set",
+}
+# Keys that repeat while they are held down
+REPEAT_KEYS = ("up", "down", "left", "right", "backspace")
+
+
+class GPIOSource:
+
+    # Push buttons on GPIO pins. pins maps key names to board pins. The buttons are expected
+    # to pull the pin to ground against the internal pull up, or to pull it high against the
+    # pull down when active_low is False.
+    def __init__(self, pins, active_low=True):
+        import digitalio
+        self._active_low = active_low
+        self._buttons = []
+        for key, pin in pins.items():
+            button = digitalio.DigitalInOut(pin)
+            button.direction = digitalio.Direction.INPUT
+            button.pull = digitalio.Pull.UP if active_low else digitalio.Pull.DOWN
+            self._buttons.append((key, button))
+
+    def pressed(self):
+        return {key for key, button in self._buttons if button.value != self._active_low}
+
+
+class KeypadSource:
+
+    # A matrix keypad, or anything else with a pressed_keys list. keymap translates the keypad
+    # keys to key names; keys missing from it are used as they are.
+    def __init__(self, keypad, keymap=None):
+        self._keypad = keypad
+        self._keymap = keymap or {}
+
+    def pressed(self):
+        return {self._keymap.get(key, key) for key in self._keypad.pressed_keys}
+
+
+class ScriptedSource:
+
+    # A fake source for testing. Each poll takes the next step of the script, which is a key
+    # name or a collection of the key names held down at that poll. Nothing is pressed once
+    # the script runs out.
+    def __init__(self, steps):
+        self._steps = iter(steps)
+
+    def pressed(self):
+        step = next(self._steps, ())
+        if isinstance(step, str):
+            return {step}
+        return set(step)
+
+
+class InputDispatcher:
+
+    # Polls the input sources from an asyncio task and calls the matching lcdzilla method for
+    # every key press. A key has to hold its state for `debounce` seconds before it counts,
+    # and the keys in the repeat set fire again every `repeat_interval` seconds once they have
+    # been held for `repeat_delay`. The events queued since the last dispatch are all applied
+    # to the menu state first and the display is brought up to date once at the end, so a
+    # burst of presses costs one screen update. Whatever enter returns is passed to on_enter
+    # before any later presses are applied, and on_key is called with every key and what its
+    # method returned.
+    def __init__(self, display, on_enter=None, on_key=None, debounce=0.02, repeat_delay=0.5, repeat_interval=0.1,
+                 poll_interval=0.005):
+        self._display = display
+        self._on_enter = on_enter
+        self._on_key = on_key
+        self._debounce = debounce
+        self._repeat_delay = repeat_delay
+        self._repeat_interval = repeat_interval
+        self._poll_interval = poll_interval
+        # Methods are looked up when a key is dispatched so instrumentation attached to the
+        # display later still sees the presses
+        self._actions = dict(KEY_ACTIONS)
+        self._repeat_keys = set(REPEAT_KEYS)
+        self._sources = []
+        # Last raw state of each key and when it changed, and when each key that is held
+        # down repeats next
+        self._raw = {}
+        self._held = {}
+        self._events = []
+        self._stop = False
+
+    def add_source(self, source):
+        self._sources.append(source)
+
+    def set_repeat_keys(self, keys):
+        self._repeat_keys = set(keys)
+
+    def post(self, key):
+        # Queue a key press for the next dispatch
+        if key not in self._actions:
+            raise Exception("Unknown key: {0}".format(key))
+        self._events.append(key)
+
+    def pending(self):
+        return len(self._events)
+
+    def poll(self, now=None):
+        # Read the sources and queue the presses and repeats of the keys that have settled
+        if now is None:
+            now = time.monotonic()
+        pressed = set()
+        for source in self._sources:
+            pressed.update(source.pressed())
+        for key in pressed.union(self._raw):
+            is_pressed = key in pressed
+            state, since = self._raw.get(key, (False, now))
+            if is_pressed != state:
+                # Any change starts the debounce time again
+                since = now
+                self._raw[key] = (is_pressed, since)
+            if now - since < self._debounce:
+                continue
+            if not is_pressed:
+                self._held.pop(key, None)
+                del self._raw[key]
+            elif key not in self._held:
+                self._held[key] = now + self._repeat_delay
+                self.post(key)
+            elif key in self._repeat_keys and now >= self._held[key]:
+                # Don't make up for repeats missed while the loop was busy
+                self._held[key] = max(self._held[key], now - self._repeat_interval) + self._repeat_interval
+                self.post(key)
+
+    def dispatch(self):
+        # Apply the queued key presses and redraw once. An enter that selects something ends
+        # the batch: the display is brought up to date and on_enter is called before the keys
+        # after it are applied, so they go to the screen the application switches to. Returns
+        # what enter returned for the presses that selected something.
+        results = []
+        while len(self._events):
+            key_results = []
+            with self._display.batch():
+                while len(self._events):
+                    key = self._events.pop(0)
+                    result = getattr(self._display, self._actions[key])()
+                    key_results.append((key, result))
+                    if key == "enter" and result is not None:
+                        break
+            if self._on_key is not None:
+                for key, result in key_results:
+                    self._on_key(key, result)
+            key, result = key_results[-1]
+            if key == "enter" and result is not None:
+                results.append(result)
+                if self._on_enter is not None:
+                    self._on_enter(result)
+        return results
+
+    async def run(self):
+        self._stop = False
+        while not self._stop:
+            self.poll()
+            # Idle polls are used to prefetch the screens likely to be shown next
+            if not self.pending() and self._display.prefetch_pending():
+                self._display.run_prefetch(1)
+            self.dispatch()
+            await asyncio.sleep(self._poll_interval)
+
+    def stop(self):
+        self._stop = True
@@ -0,0 +1,149 @@
+import bisect
+import threading
+import time
+
+# Upper bounds in seconds of the timing histogram buckets. The last bucket takes the rest.
+TIME_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
+
+# lcdzilla methods that are timed and the operation each one is counted as
+OPERATIONS = {
+    "load_screen": "load_screen",
+    "switch_screen": "switch_screen",
+    "_scroll": "scroll",
+    "load_status_line": "status_line",
+    "refresh_bound_fields": "bound_fields",
+    "sync_display": "sync",
+}
+# Key presses count as edit keystrokes while a field is being edited and as navigation
+# otherwise
+KEY_OPERATIONS = ("cursor_up", "cursor_down", "cursor_left", "cursor_right", "enter", "backspace",
+                  "sel_character_set")
+# Backend calls that send something to the LCD
+BACKEND_CALLS = ("clear", "set_cursor_pos", "set_cursor_mode", "print", "create_char")
+
+
+class Instrumentation:
+
+    # Counters and timing histograms for the lcdzilla operations along with the command and
+    # data bytes each one sent to the LCD. Attaching wraps the methods of one display and its
+    # backend; a display without instrumentation runs its methods unwrapped so there is no
+    # cost at all when it is off. The numbers of an operation include the operations it
+    # calls, so a scroll caused by cursor_down is counted under both scroll and navigate.
+    # Totals by screen only count the outermost operations and use the names given with
+    # name_screen.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._screen_names = {}
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._operations = {}
+            self._screens = {}
+            self._commands = 0
+            self._data_bytes = 0
+
+    def name_screen(self, screen_def, name):
+        self._screen_names[id(screen_def)] = name
+
+    def attach(self, display):
+        for method_name, operation in OPERATIONS.items():
+            setattr(display, method_name, self._timed(display, getattr(display, method_name), operation))
+        for method_name in KEY_OPERATIONS:
+            setattr(display, method_name, self._timed(display, getattr(display, method_name), None))
+        backend = display.get_backend()
+        for method_name in BACKEND_CALLS:
+            setattr(backend, method_name, self._counted(getattr(backend, method_name), method_name))
+
+    def detach(self, display):
+        # Removing the wrappers uncovers the class methods again
+        for method_name in list(OPERATIONS) + list(KEY_OPERATIONS):
+            display.__dict__.pop(method_name, None)
+        backend = display.get_backend()
+        for method_name in BACKEND_CALLS:
+            backend.__dict__.pop(method_name, None)
+
+    def snapshot(self):
+        # A copy of everything counted so far as plain dicts and lists
+        bucket_names = ["<={0}".format(bound) for bound in TIME_BUCKETS] + [">{0}".format(TIME_BUCKETS[-1])]
+        with self._lock:
+            operations = {}
+            for operation, stats in self._operations.items():
+                operations[operation] = dict(stats)
+                operations[operation]["histogram"] = dict(zip(bucket_names, stats["histogram"]))
+            return {
+                "operations": operations,
+                "screens": {name: dict(stats) for name, stats in self._screens.items()},
+                "lcd": {"commands": self._commands, "data_bytes": self._data_bytes},
+            }
+
+    def _stack(self):
+        # The operations running on this thread, innermost last
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _timed(self, display, method, operation):
+        def timed(*args, **kwargs):
+            if operation is None:
+                name = "edit_key" if display.is_editing() else "navigate"
+            else:
+                name = operation
+            stack = self._stack()
+            # Operation name, commands and data bytes
+            entry = [name, 0, 0]
+            stack.append(entry)
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                stack.pop()
+                screen = None
+                if not len(stack):
+                    screen = self._screen_names.get(id(display.get_screen()))
+                self._record(entry, elapsed, screen)
+        return timed
+
+    def _counted(self, method, method_name):
+        def counted(*args):
+            if method_name == "print":
+                commands, data_bytes = 0, len(args[0])
+            elif method_name == "create_char":
+                commands, data_bytes = 1, len(args[1])
+            else:
+                commands, data_bytes = 1, 0
+            for entry in self._stack():
+                entry[1] += commands
+                entry[2] += data_bytes
+            with self._lock:
+                self._commands += commands
+                self._data_bytes += data_bytes
+            return method(*args)
+        return counted
+
+    def _record(self, entry, elapsed, screen):
+        operation, commands, data_bytes = entry
+        with self._lock:
+            stats = self._operations.get(operation)
+            if stats is None:
+                stats = self._operations[operation] = {"count": 0, "total_time": 0.0, "max_time": 0.0,
+                                                       "commands": 0, "data_bytes": 0,
+                                                       "histogram": [0] * (len(TIME_BUCKETS) + 1)}
+            stats["count"] += 1
+            stats["total_time"] += elapsed
+            stats["max_time"] = max(stats["max_time"], elapsed)
+            stats["commands"] += commands
+            stats["data_bytes"] += data_bytes
+            stats["histogram"][bisect.bisect_left(TIME_BUCKETS, elapsed)] += 1
+            if screen is not None:
+                totals = self._screens.get(screen)
+                if totals is None:
+                    totals = self._screens[screen] = {"count": 0, "total_time": 0.0, "commands": 0,
+                                                      "data_bytes": 0}
+                totals["count"] += 1
+                totals["total_time"] += elapsed
+                totals["commands"] += commands
+                totals["data_bytes"] += data_bytes
@@ -0,0 +1,215 @@
+import math
+from collections import OrderedDict
+from lcdzilla_model import FIELD_NUMBER_EDIT, Row, Screen, to_row
+
+
+class _Immutable:
+
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{0} is immutable".format(type(self).__name__))
+
+
+class CompiledRow(_Immutable):
+
+    # The compiled form of one line of a screen definition: the padded text, the columns
+    # where the cursor can appear, the index of the selectable subfields, the starting
+    # column and width of every subfield, the index of the subfields bound to a live value
+    # and the Fields themselves.
+    __slots__ = ("text", "cursor_positions", "selectable_fields", "field_spans", "bound_fields", "fields")
+
+    def __init__(self, text, cursor_positions, selectable_fields, field_spans, bound_fields=(), fields=()):
+        object.__setattr__(self, "text", text)
+        object.__setattr__(self, "cursor_positions", cursor_positions)
+        object.__setattr__(self, "selectable_fields", selectable_fields)
+        object.__setattr__(self, "field_spans", field_spans)
+        object.__setattr__(self, "bound_fields", bound_fields)
+        object.__setattr__(self, "fields", fields)
+
+
+class CompiledScreen(_Immutable):
+
+    # A compiled screen holds everything lcdzilla needs to show a screen definition that
+    # doesn't change while it is displayed: the compiled rows and which field is being
+    # edited. It is immutable once built so the same object can be shown again and again
+    # without recomputing anything.
+    __slots__ = ("source", "version", "rows", "edit_item", "edit_numbers")
+
+    def __init__(self, source, version, rows, edit_item, edit_numbers):
+        object.__setattr__(self, "source", source)
+        object.__setattr__(self, "version", version)
+        object.__setattr__(self, "rows", rows)
+        # (line, subfield) of the field being edited or None
+        object.__setattr__(self, "edit_item", edit_item)
+        object.__setattr__(self, "edit_numbers", edit_numbers)
+
+    @property
+    def num_rows(self):
+        return len(self.rows)
+
+    def row(self, line_idx):
+        return self.rows[line_idx]
+
+
+class VirtualScreen:
+
+    # A screen definition whose lines are produced on demand by a provider callback, for
+    # menus with far more lines than it makes sense to build up front. provider is called
+    # with the line index and returns the line as a Row or a list of subfield dicts.
+    def __init__(self, num_rows, provider):
+        self._num_rows = num_rows
+        self._provider = provider
+
+    def __len__(self):
+        return self._num_rows
+
+    def __getitem__(self, line_idx):
+        if line_idx < 0:
+            line_idx += self._num_rows
+        if line_idx < 0 or line_idx >= self._num_rows:
+            raise IndexError("screen line out of range")
+        return self._provider(line_idx)
+
+
+class LazyCompiledScreen:
+
+    # Compiled layout for a sequence-like screen source such as a VirtualScreen. Rows are
+    # compiled the first time they are shown and only the most recently used ones are kept,
+    # so the cost of showing and scrolling the screen depends on the number of visible rows
+    # rather than the length of the source. Lazy screens are read only menus; editing needs
+    # a regular screen definition.
+    edit_item = None
+    edit_numbers = False
+
+    def __init__(self, source, num_characters, version=0, cache_rows=64):
+        self._source = source
+        self._num_characters = num_characters
+        self._version = version
+        self._cache_rows = cache_rows
+        self._rows = OrderedDict()
+
+    @property
+    def source(self):
+        return self._source
+
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def num_rows(self):
+        return len(self._source)
+
+    def row(self, line_idx):
+        row = self._rows.get(line_idx)
+        if row is not None:
+            self._rows.move_to_end(line_idx)
+            return row
+        row = compile_line(self._source[line_idx], self._num_characters)
+        self._rows[line_idx] = row
+        if len(self._rows) > self._cache_rows:
+            self._rows.popitem(last=False)
+        return row
+
+
+def compile_line(line, num_characters):
+
+    # Build the text for one line of the screen definition along with the columns where the
+    # cursor can appear on it, the selectable subfields and the span of every subfield
+    row = to_row(line)
+    lcd_line = ""
+    cursor_positions = []
+    selectable_fields = []
+    field_spans = []
+    bound_fields = []
+    # How many subfields? Should we have a maximum?
+    num_subfields = len(row)
+    # Determine the length of each subfield in the line
+    subfield_len = math.floor(num_characters / num_subfields)
+    if subfield_len < num_characters:
+        subfield_len += 1
+    field_format = "{0:" + str(subfield_len) + "." + str(subfield_len) + "}"
+    for field_idx, field in enumerate(row.fields):
+        # Is this field selectable?
+        if field.selectable:
+            cursor_positions.append(len(lcd_line))
+            selectable_fields.append(field_idx)
+        # Is this field bound to a live value?
+        if field.bind is not None:
+            bound_fields.append(field_idx)
+        # Fields past the end of the display have no width
+        field_col = min(len(lcd_line), num_characters)
+        field_spans.append((field_col, min(subfield_len, num_characters-field_col)))
+        # Construct the line to write to the LCD
+        if type(field.text) == int:
+            text = str(field.text)
+        else:
+            text = field.text
+        lcd_line += field_format.format(text)
+    # The line cannot be longer than the number of characters defined.
+    lcd_line = ("{0:" + str(num_characters) + "." + str(num_characters) + "}").format(lcd_line)
+    return CompiledRow(lcd_line, tuple(cursor_positions), tuple(selectable_fields), tuple(field_spans),
+                       tuple(bound_fields), row.fields)
+
+
+def is_lazy(screen_def):
+
+    # Anything other than a plain list or tuple or a Screen is a lazy source, compiled a row
+    # at a time
+    return not isinstance(screen_def, (list, tuple, Screen))
+
+
+def screen_signature(screen_def):
+
+    # A snapshot of everything in a screen definition that goes into its compiled layout, to
+    # tell whether the definition changed since it was compiled. Lines of subfield dicts are
+    # copied, Rows are reduced to the values of their fields. Only plain lists and tuples
+    # and Screens can be checked; lazy sources return None.
+    if is_lazy(screen_def):
+        return None
+    return [_line_signature(line) for line in screen_def]
+
+
+def _line_signature(line):
+    if isinstance(line, Row):
+        return tuple((field.text, field.kind, field.selectable, field.bind) for field in line.fields)
+    return [dict(subfield) for subfield in line]
+
+
+def same_content(screen_def, signature):
+
+    # Whether a screen definition still matches the signature taken from it. A definition
+    # made of subfield dicts equals its copies, which Python compares without building
+    # anything, so the line by line check only runs when there are Rows or something changed.
+    if list(screen_def) == signature:
+        return True
+    if len(screen_def) != len(signature):
+        return False
+    for line, line_signature in zip(screen_def, signature):
+        if isinstance(line, Row):
+            if _line_signature(line) != line_signature:
+                return False
+        elif line != line_signature:
+            return False
+    return True
+
+
+def compile_screen(screen_def, num_characters, version=0):
+
+    if is_lazy(screen_def):
+        return LazyCompiledScreen(screen_def, num_characters, version)
+
+    rows = []
+    edit_item = None
+    edit_numbers = False
+    for line_idx, line in enumerate(screen_def):
+        row = compile_line(line, num_characters)
+        rows.append(row)
+        # Is there a field to edit? The last one wins.
+        for field_idx, field in enumerate(row.fields):
+            if field.editable:
+                edit_item = (line_idx, field_idx)
+                edit_numbers = (field.kind == FIELD_NUMBER_EDIT)
+
+    return CompiledScreen(screen_def, version, tuple(rows), edit_item, edit_numbers)
@@ -0,0 +1,128 @@
+import threading
+from lcdzilla import lcdzilla
+from lcdzilla_backend import PCF8574Backend
+
+
+class DisplayManager:
+
+    # Owns a single I2C bus shared by several displays at different PCF8574 addresses. Each
+    # display keeps its own menu state; when one changes it tells the manager, and the
+    # manager sends the pending changes of all the displays in weighted round robin order.
+    # Every turn a display sends up to `priority` runs of changed characters, so a display
+    # redrawing a long menu can't hold up a status update on another one.
+    def __init__(self, scl_pin=None, sda_pin=None, i2c=None):
+        if i2c is None:
+            import busio
+            i2c = busio.I2C(scl_pin, sda_pin)
+        self._i2c = i2c
+        self._displays = []
+        self._priorities = {}
+        self._pending = set()
+        self._active = set()
+        self._next_display = 0
+        self._condition = threading.Condition()
+        # Only one thread at a time talks to the bus
+        self._bus_lock = threading.Lock()
+        self._thread = None
+        self._stop = False
+
+    def get_i2c(self):
+        return self._i2c
+
+    def add_display(self, addr, num_lines=4, num_characters=20, priority=1, backend=None):
+        self._check_priority(priority)
+        # Setting up the display talks to the bus, so it waits for the manager thread
+        with self._bus_lock:
+            if backend is None:
+                backend = PCF8574Backend(addr, num_lines=num_lines, num_characters=num_characters, i2c=self._i2c)
+            display = lcdzilla(lcdzilla.LCD_PFC8574, addr, None, None, num_lines=num_lines,
+                               num_characters=num_characters, backend=backend)
+        display.set_display_manager(self)
+        with self._condition:
+            self._displays.append(display)
+            self._priorities[display] = priority
+        return display
+
+    def set_priority(self, display, priority):
+        self._check_priority(priority)
+        with self._condition:
+            self._priorities[display] = priority
+
+    def _check_priority(self, priority):
+        # A display has to send at least one run per turn or it would never finish
+        if priority < 1:
+            raise Exception("Display priority must be at least 1: {0}".format(priority))
+
+    def display_changed(self, display):
+        with self._condition:
+            self._pending.add(display)
+            self._condition.notify_all()
+
+    def pending(self):
+        with self._condition:
+            return len(self._pending) > 0
+
+    def service(self, max_turns=None):
+        # Give every display with pending changes its turns until nothing is left, or until
+        # max_turns turns have been taken. Returns True when there is still work pending.
+        turns = 0
+        while max_turns is None or turns < max_turns:
+            with self._condition:
+                if not self._pending:
+                    self._condition.notify_all()
+                    return False
+                # Pick the next display with pending changes after the one served last
+                for offset in range(len(self._displays)):
+                    idx = (self._next_display + offset) % len(self._displays)
+                    if self._displays[idx] in self._pending:
+                        break
+                display = self._displays[idx]
+                self._next_display = idx + 1
+                # A change made from here on will set it pending again
+                self._pending.discard(display)
+                self._active.add(display)
+                priority = self._priorities[display]
+            with self._bus_lock:
+                remaining = display.sync_display(max_runs=priority)
+            with self._condition:
+                self._active.discard(display)
+                if remaining:
+                    self._pending.add(display)
+                self._condition.notify_all()
+            turns += 1
+        return self.pending()
+
+    def start(self):
+        # Service the displays from a background thread
+        if self._thread is not None:
+            return
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="lcdzilla-manager", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        with self._condition:
+            self._stop = True
+            self._condition.notify_all()
+        self._thread.join()
+        self._thread = None
+
+    def flush(self, timeout=None):
+        # Wait until every display is up to date. Without the background thread the work is
+        # done here.
+        if self._thread is None:
+            self.service()
+            return True
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._active, timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stop:
+                    self._condition.wait()
+                if self._stop and not self._pending:
+                    return
+            self.service(max_turns=len(self._displays))
@@ -0,0 +1,123 @@
+# Kinds of field. The kind is worked out once when a field is built so the menu code can
+# branch on it instead of looking for keys in the subfield dict.
+FIELD_STATIC = 0
+FIELD_SELECTABLE = 1
+FIELD_TEXT_EDIT = 2
+FIELD_NUMBER_EDIT = 3
+
+
+class Field:
+
+    # One subfield of a screen line. A field converted from a subfield dict keeps the dict as
+    # its source and its text lives there, so edits show up in the dicts applications read,
+    # or get back from enter, and changes the application makes to the dicts are seen by the
+    # field.
+    __slots__ = ("kind", "selectable", "_text", "min_value", "max_value", "max_len", "step", "bind",
+                 "interval", "format", "source")
+
+    def __init__(self, text, kind=FIELD_STATIC, selectable=None, min_value=None, max_value=None,
+                 max_len=None, step=1, bind=None, interval=None, format=None, source=None):
+        self.kind = kind
+        # Edit fields can be selected unless told otherwise
+        if selectable is None:
+            selectable = kind != FIELD_STATIC
+        self.selectable = selectable
+        self.source = source
+        self._text = None if source is not None else text
+        self.min_value = min_value
+        self.max_value = max_value
+        self.max_len = max_len
+        self.step = step
+        # A callable or value the field shows live, how often it is read and the format
+        # string its value is shown with
+        self.bind = bind
+        self.interval = interval
+        self.format = format
+
+    @property
+    def text(self):
+        if self.source is not None:
+            return self.source["text"]
+        return self._text
+
+    @text.setter
+    def text(self, value):
+        if self.source is not None:
+            self.source["text"] = value
+        else:
+            self._text = value
+
+    @property
+    def editable(self):
+        return self.kind == FIELD_TEXT_EDIT or self.kind == FIELD_NUMBER_EDIT
+
+    @classmethod
+    def from_dict(cls, subfield):
+        # text element is required
+        if "text" not in subfield:
+            raise Exception("'text' element missing from definition")
+        if subfield.get("edit") is True:
+            if subfield.get("type") == "number":
+                kind = FIELD_NUMBER_EDIT
+            else:
+                kind = FIELD_TEXT_EDIT
+        elif subfield.get("select") is True:
+            kind = FIELD_SELECTABLE
+        else:
+            kind = FIELD_STATIC
+        return cls(subfield["text"], kind, selectable=(subfield.get("select") is True),
+                   min_value=subfield.get("min_value"), max_value=subfield.get("max_value"),
+                   max_len=subfield.get("max_len"), step=subfield.get("step", 1),
+                   bind=subfield.get("bind"), interval=subfield.get("interval"),
+                   format=subfield.get("format"), source=subfield)
+
+    def selected(self):
+        # What enter gives back for this field
+        if self.source is not None:
+            return self.source
+        return self
+
+
+class Row:
+
+    # One line of a screen
+    __slots__ = ("fields",)
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __getitem__(self, field_idx):
+        return self.fields[field_idx]
+
+    @classmethod
+    def from_list(cls, line):
+        return cls(Field.from_dict(subfield) for subfield in line)
+
+
+class Screen:
+
+    # A whole screen built from Rows, which can be loaded in place of a list of lines
+    __slots__ = ("rows",)
+
+    def __init__(self, rows):
+        self.rows = tuple(rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, line_idx):
+        return self.rows[line_idx]
+
+    @classmethod
+    def from_list(cls, screen_def):
+        return cls(Row.from_list(line) for line in screen_def)
+
+
+def to_row(line):
+    # Lines can be given as Rows or as lists of subfield dicts
+    if isinstance(line, Row):
+        return line
+    return Row.from_list(line)
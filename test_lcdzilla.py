@@ -0,0 +1,253 @@
+import pytest
+from conftest import FakeI2C, clears, make_display, make_menu, pad, text_screen
+from lcdzilla import lcdzilla
+from lcdzilla_backend import SimulatedBackend
+
+# Regression tests for rendering, the layout cache, bound fields, startup and page switching,
+# run against the simulated HD44780 so they need no hardware
+
+# Diff runs and the clear choice
+
+def test_line_runs_merge_short_gaps():
+    display = make_display()
+    # A one character gap costs no more to rewrite than a cursor move, a longer one is skipped
+    assert display._line_runs("aaaaaaaa", "abaCaaaa") == [[1, "baC"]]
+    assert display._line_runs("aaaaaaaa", "baaaaaab") == [[0, "b"], [7, "b"]]
+    assert display._line_runs("aaaa", "aaaa") == []
+    # Unknown rows are sent whole
+    assert display._line_runs(None, "abcd") == [[0, "abcd"]]
+
+
+def test_small_change_only_writes_changed_cells():
+    display = make_display()
+    screen = [[{"text": "Temperature"}], [{"text": "Humidity"}]]
+    display.load_screen(screen)
+    backend = display.get_backend()
+    backend.reset_stats()
+    display.load_status_line("Ok")
+    stats = backend.stats()
+    assert stats["data_bytes"] == 2
+    assert clears(display) == 0
+    assert backend.text()[3] == pad("Ok".center(20))
+
+
+def test_clear_used_when_cheaper_than_diff():
+    display = make_display()
+    display.load_screen([[{"text": "x" * 20}] for _ in range(4)])
+    backend = display.get_backend()
+    backend.reset_stats()
+    # Blanking almost every cell costs more than a clear and a short write
+    display.load_screen([[{"text": "Hi"}]])
+    assert clears(display) == 1
+    assert backend.stats()["data_bytes"] == 2
+    assert backend.text() == [pad("Hi"), pad(""), pad(""), pad("")]
+
+
+def test_reloading_same_screen_sends_nothing():
+    display = make_display()
+    menu = make_menu(10, values=False)
+    display.load_screen(menu)
+    backend = display.get_backend()
+    backend.reset_stats()
+    display.load_screen(menu)
+    assert backend.stats()["data_bytes"] == 0
+    assert clears(display) == 0
+
+
+def test_edit_sees_text_changed_by_application():
+    display = make_display()
+    screen = text_screen()
+    display.load_screen(screen)
+    display.cursor_down()
+    display.cursor_down()
+    assert screen[1][0]["text"] == "b"
+    screen[1][0]["text"] = "zz"
+    display.load_screen(screen)
+    assert display.get_backend().text()[1] == pad("zz")
+    display.cursor_down()
+    assert screen[1][0]["text"] == "az"
+
+
+# Layout cache
+
+def test_reload_shows_changed_definition():
+    display = make_display()
+    screen = [[{"text": "Temp 10"}], [{"text": "Back", "select": True}]]
+    display.load_screen(screen)
+    layout = display.compile_screen(screen)
+    screen[0][0]["text"] = "Temp 99"
+    display.load_screen(screen)
+    assert display.get_backend().text()[0] == pad("Temp 99")
+    assert display.compile_screen(screen) is not layout
+
+
+def test_unchanged_definition_uses_cached_layout():
+    display = make_display()
+    menu = make_menu(10, values=False)
+    display.load_screen(menu)
+    assert display.compile_screen(menu) is display.compile_screen(menu)
+
+
+def test_reload_shows_changed_model_screen():
+    from lcdzilla_model import Field, Row, Screen
+    display = make_display()
+    label = Field("Temp 10")
+    screen = Screen([Row([label]), Row([Field("Back", selectable=True)])])
+    display.load_screen(screen)
+    layout = display.compile_screen(screen)
+    assert display.compile_screen(screen) is layout
+    label.text = "Temp 99"
+    display.load_screen(screen)
+    assert display.get_backend().text()[0] == pad("Temp 99")
+
+
+def test_reload_shows_changed_tuple_screen():
+    display = make_display()
+    screen = ([{"text": "Temp 10"}], [{"text": "Back", "select": True}])
+    display.load_screen(screen)
+    assert display.compile_screen(screen) is display.compile_screen(screen)
+    screen[1].append({"text": "Next", "select": True})
+    display.load_screen(screen)
+    assert display.get_backend().text()[1] == pad("Back       Next")
+
+
+def test_versioned_layout_is_trusted_until_bumped():
+    display = make_display()
+    screen = [[{"text": "Temp 10"}]]
+    display.load_screen(screen, version=1)
+    screen[0][0]["text"] = "Temp 99"
+    display.load_screen(screen, version=1)
+    assert display.get_backend().text()[0] == pad("Temp 10")
+    display.load_screen(screen, version=2)
+    assert display.get_backend().text()[0] == pad("Temp 99")
+
+
+def test_reload_shows_changed_lazy_source():
+    from lcdzilla_layout import VirtualScreen
+    display = make_display()
+    lines = ["old {0}".format(row) for row in range(100)]
+    screen = VirtualScreen(len(lines), lambda line_idx: [{"text": lines[line_idx], "select": True}])
+    display.load_screen(screen)
+    lines[0] = "new 0"
+    display.load_screen(screen)
+    assert display.get_backend().text()[0] == pad("new 0")
+
+
+# Bound fields
+
+def test_pushed_value_stays_on_screen():
+    display = make_display()
+    display.load_screen([[{"text": "v", "bind": "v", "interval": 0}]])
+    display.update_field(0, 0, "pushed")
+    assert display.get_backend().text()[0] == pad("pushed")
+    display.refresh_bound_fields()
+    assert display.get_backend().text()[0] == pad("pushed")
+
+
+def test_callable_bind_is_read_when_due():
+    values = iter(range(10))
+    display = make_display()
+    display.load_screen([[{"text": "", "bind": lambda: next(values), "format": "n={0}", "interval": 0}]])
+    assert display.get_backend().text()[0] == pad("n=0")
+    display.refresh_bound_fields()
+    assert display.get_backend().text()[0] == pad("n=1")
+
+
+# Startup
+
+class UnknownBackend(SimulatedBackend):
+
+    # A display that may still show whatever was there before
+    starts_blank = False
+
+
+def test_blank_backend_is_not_cleared_again():
+    from lcdzilla_backend import PCF8574Backend
+    i2c = FakeI2C()
+    backend = PCF8574Backend(0x27, i2c=i2c)
+    init_writes = len(i2c.writes)
+    display = lcdzilla(lcdzilla.LCD_PFC8574, 0x27, None, None, backend=backend)
+    assert len(i2c.writes) == init_writes
+    display.load_screen([[{"text": "Hello"}]])
+    # The first screen goes out in one transaction without a clear
+    assert len(i2c.writes) == init_writes + 1
+
+
+def test_unknown_backend_is_cleared():
+    backend = UnknownBackend()
+    lcdzilla(lcdzilla.LCD_SIMULATED, None, None, None, backend=backend)
+    assert backend.stats()["operations"]["clear"]["count"] == 1
+
+
+def test_no_init_leaves_unknown_display_alone():
+    backend = UnknownBackend()
+    display = lcdzilla(lcdzilla.LCD_SIMULATED, None, None, None, backend=backend, init_display=False)
+    assert backend.stats()["commands"] == 0
+    display.load_screen([[{"text": "Hello"}]])
+    assert backend.text()[0] == pad("Hello")
+
+
+@pytest.mark.parametrize("backend_class", [SimulatedBackend, UnknownBackend])
+def test_splash_replaces_clear(backend_class):
+    backend = backend_class()
+    lcdzilla(lcdzilla.LCD_SIMULATED, None, None, None, backend=backend, splash=["lcdzilla", "starting"])
+    assert "clear" not in backend.stats()["operations"]
+    assert backend.text() == [pad("lcdzilla"), pad("starting"), pad(""), pad("")]
+
+
+# Page switching
+
+def test_switch_screen_never_clears():
+    display = make_display()
+    display.load_screen([[{"text": "x" * 20}] for _ in range(4)])
+    backend = display.get_backend()
+    backend.reset_stats()
+    display.switch_screen([[{"text": "Hi"}]])
+    assert clears(display) == 0
+    assert backend.text() == [pad("Hi"), pad(""), pad(""), pad("")]
+
+
+def test_switch_while_syncing_keeps_no_clear():
+    display = make_display()
+    display.load_screen([[{"text": "x" * 20}] for _ in range(4)])
+    backend = display.get_backend()
+    backend_print = backend.print
+    switched = []
+
+    def print_and_switch(text):
+        # Another thread switches page while this frame is being written
+        backend_print(text)
+        if not switched:
+            switched.append(True)
+            display._batch_depth += 1
+            display.switch_screen([[{"text": "Hi"}]])
+            display._batch_depth -= 1
+
+    backend.print = print_and_switch
+    display.switch_screen([[{"text": "y" * 20}] for _ in range(4)])
+    backend.print = backend_print
+    display.sync_display()
+    assert clears(display) == 0
+    assert backend.text() == [pad("Hi"), pad(""), pad(""), pad("")]
+
+
+@pytest.mark.parametrize("version", [None, 3])
+def test_switch_uses_prefetched_lazy_screen(version):
+    from lcdzilla_layout import VirtualScreen
+    calls = []
+
+    def provider(line_idx):
+        calls.append(line_idx)
+        return [{"text": "Log {0}".format(line_idx), "select": True}]
+
+    display = make_display()
+    menu = make_menu(3, values=False)
+    log = VirtualScreen(1000, provider)
+    display.set_next_screens(menu, [log], versions=[version])
+    display.load_screen(menu)
+    assert display.prefetch_pending()
+    assert not display.run_prefetch()
+    assert calls == [0, 1, 2, 3]
+    display.switch_screen(log, version=version)
+    assert calls == [0, 1, 2, 3]
+    assert display.get_backend().text()[3] == pad("Log 3")
@@ -0,0 +1,78 @@
+import pytest
+from conftest import FakeI2C
+from lcdzilla_backend import CURSOR_BLINK, PCF8574Backend
+
+# Tests for the bytes PCF8574Backend sends to the expander
+
+BACKLIGHT = PCF8574Backend.BACKLIGHT
+ENABLE = PCF8574Backend.ENABLE
+RS = PCF8574Backend.RS
+
+
+def expander_bytes(value, mode):
+    # The four expander writes of one LCD byte: each nibble with enable high, then low
+    high = (value & 0xF0) | mode | BACKLIGHT
+    low = ((value << 4) & 0xF0) | mode | BACKLIGHT
+    return bytes([high | ENABLE, high, low | ENABLE, low])
+
+
+def make_backend(num_lines=4, num_characters=20):
+    i2c = FakeI2C()
+    backend = PCF8574Backend(0x27, num_lines=num_lines, num_characters=num_characters, i2c=i2c)
+    # Forget the power on sequence
+    i2c.writes = []
+    return backend, i2c
+
+
+def test_data_bytes_set_rs_and_strobe_enable():
+    backend, i2c = make_backend()
+    backend.print("A")
+    assert i2c.writes == []
+    backend.flush()
+    assert i2c.writes == [(0x27, bytes([0x4D, 0x49, 0x1D, 0x19]))]
+    assert i2c.writes[0][1] == expander_bytes(ord("A"), RS)
+
+
+def test_commands_leave_rs_clear():
+    backend, i2c = make_backend()
+    backend.set_cursor_mode(CURSOR_BLINK)
+    backend.flush()
+    assert i2c.writes == [(0x27, expander_bytes(0x08 | 0x04 | 0x01, 0))]
+
+
+@pytest.mark.parametrize("row, col, address", [(0, 5, 0x05), (1, 0, 0x40), (2, 3, 0x17), (3, 19, 0x67)])
+def test_row_offsets(row, col, address):
+    backend, i2c = make_backend()
+    backend.set_cursor_pos(row, col)
+    backend.flush()
+    assert i2c.writes == [(0x27, expander_bytes(0x80 | address, 0))]
+
+
+def test_updates_are_batched_into_one_transaction():
+    backend, i2c = make_backend()
+    backend.set_cursor_pos(1, 0)
+    backend.print("Hi")
+    backend.flush()
+    assert i2c.writes == [(0x27, expander_bytes(0xC0, 0) + expander_bytes(ord("H"), RS) + expander_bytes(ord("i"), RS))]
+    backend.flush()
+    assert len(i2c.writes) == 1
+
+
+def test_full_buffer_is_flushed_early():
+    backend, i2c = make_backend()
+    # The buffer holds a screen of data plus a cursor move per row: 84 LCD bytes
+    text = "".join(chr(ord("a") + idx % 26) for idx in range(100))
+    backend.print(text)
+    assert [len(data) for addr, data in i2c.writes] == [84 * 4]
+    backend.flush()
+    assert [len(data) for addr, data in i2c.writes] == [84 * 4, 16 * 4]
+    sent = b"".join(data for addr, data in i2c.writes)
+    assert sent == b"".join(expander_bytes(ord(char), RS) for char in text)
+
+
+def test_clear_is_flushed_straight_away():
+    backend, i2c = make_backend()
+    backend.print("x")
+    # The clear goes out with what is pending so the controller can start on it
+    backend.clear()
+    assert i2c.writes == [(0x27, expander_bytes(ord("x"), RS) + expander_bytes(0x01, 0))]
@@ -0,0 +1,66 @@
+import pytest
+from conftest import make_display, pad, text_screen
+
+# Tests for editing text fields with the character sets
+
+
+def test_character_cycles_within_set():
+    display = make_display()
+    screen = text_screen()
+    display.load_screen(screen)
+    display.cursor_up()
+    assert screen[1][0]["text"] == "z"
+    display.cursor_down()
+    display.cursor_down()
+    assert screen[1][0]["text"] == "b"
+    display.cursor_right()
+    display.cursor_down()
+    assert screen[1][0]["text"] == "ba"
+    assert display.get_backend().text()[1] == pad("ba")
+
+
+def test_sel_character_set_cycles_sets_and_label():
+    display = make_display()
+    screen = text_screen()
+    display.load_screen(screen)
+    backend = display.get_backend()
+    assert backend.text()[2] == "*=Uppr #=Bkspc".center(20)
+    labels = []
+    for _ in range(4):
+        display.sel_character_set()
+        labels.append(backend.text()[2].strip())
+    assert labels == ["*=Symb #=Bkspc", "*=Numb #=Bkspc", "*=Lowr #=Bkspc", "*=Uppr #=Bkspc"]
+    display.sel_character_set()
+    display.cursor_down()
+    assert screen[1][0]["text"] == "A"
+
+
+def test_initial_set_follows_text():
+    display = make_display()
+    screen = text_screen("7")
+    display.load_screen(screen)
+    assert display.get_backend().text()[2] == "*=Lowr #=Bkspc".center(20)
+    display.cursor_down()
+    assert screen[1][0]["text"] == "8"
+
+
+def test_character_set_order():
+    display = make_display()
+    display.set_character_set_order(["numbers", "lower"])
+    screen = text_screen()
+    display.load_screen(screen)
+    display.cursor_down()
+    assert screen[1][0]["text"] == "0"
+    display.sel_character_set()
+    display.cursor_down()
+    assert screen[1][0]["text"] == "a"
+
+
+@pytest.mark.parametrize("key", ["cursor_up", "cursor_down"])
+def test_edit_writes_single_character(key):
+    display = make_display()
+    display.load_screen(text_screen("abc"))
+    backend = display.get_backend()
+    backend.reset_stats()
+    getattr(display, key)()
+    assert backend.stats()["data_bytes"] == 1
@@ -0,0 +1,60 @@
+import asyncio
+import socket
+import pytest
+from conftest import make_display, pad
+from lcdzilla import lcdzilla
+from lcdzilla_daemon import DisplayClient, DisplayDaemon
+
+# Tests for the display daemon, with the client and daemon in the same process
+
+
+def test_pushed_values_reach_display(tmp_path):
+    path = str(tmp_path / "lcd.sock")
+    display = make_display()
+
+    async def run():
+        daemon = DisplayDaemon(display, path)
+        await daemon.start()
+        client = DisplayClient(path)
+        try:
+            client.load_screen([[{"text": "v", "bind": "v"}]])
+            for value in range(5):
+                client.update_field(0, 0, "value {0}".format(value))
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(lcdzilla.BIND_INTERVAL * 3)
+        finally:
+            client.close()
+            await daemon.close()
+
+    asyncio.run(run())
+    assert display.get_backend().text()[0] == pad("value 4")
+
+
+def test_running_daemon_keeps_its_socket(tmp_path):
+    path = str(tmp_path / "lcd.sock")
+
+    async def run():
+        daemon = DisplayDaemon(make_display(), path)
+        await daemon.start()
+        try:
+            with pytest.raises(Exception, match="already using"):
+                await DisplayDaemon(make_display(), path).start()
+            DisplayClient(path).close()
+        finally:
+            await daemon.close()
+
+    asyncio.run(run())
+
+
+def test_stale_socket_is_replaced(tmp_path):
+    path = str(tmp_path / "lcd.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+
+    async def run():
+        daemon = DisplayDaemon(make_display(), path)
+        await daemon.start()
+        await daemon.close()
+
+    asyncio.run(run())
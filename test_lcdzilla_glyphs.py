@@ -0,0 +1,77 @@
+from conftest import make_display
+from lcdzilla_glyphs import GlyphRegistry
+
+# Tests for loading custom glyphs into the CGRAM slots of the simulated display
+
+
+def make_glyphs(count):
+    registry = GlyphRegistry()
+    chars = [registry.register("g{0}".format(idx), [idx] * 8) for idx in range(count)]
+    return registry, chars
+
+
+def glyph_display(registry):
+    display = make_display()
+    display.set_glyph_registry(registry)
+    return display
+
+
+def uploads(display):
+    return display.get_backend().stats()["operations"].get("create_char", {}).get("count", 0)
+
+
+def test_resident_glyph_is_not_uploaded_again():
+    registry, chars = make_glyphs(2)
+    display = glyph_display(registry)
+    display.load_screen([[{"text": "Vol " + chars[0]}]])
+    backend = display.get_backend()
+    assert uploads(display) == 1
+    assert backend.cgram(0) == registry.bitmap(chars[0])
+    assert backend.text()[0][4] == chr(0)
+    display.load_screen([[{"text": "Bal " + chars[0]}], [{"text": chars[0]}]])
+    assert uploads(display) == 1
+    assert backend.text()[1][0] == chr(0)
+
+
+def test_least_recently_used_glyph_is_evicted():
+    registry, chars = make_glyphs(9)
+    display = glyph_display(registry)
+    display.load_screen([[{"text": "".join(chars[:8])}]])
+    assert uploads(display) == 8
+    # Using the first glyph again makes the second one the least recently used
+    display.load_screen([[{"text": chars[0]}]])
+    display.load_screen([[{"text": chars[0] + chars[8]}]])
+    backend = display.get_backend()
+    assert uploads(display) == 9
+    assert backend.cgram(1) == registry.bitmap(chars[8])
+    assert backend.cgram(0) == registry.bitmap(chars[0])
+    assert backend.text()[0][:2] == chr(0) + chr(1)
+
+
+def test_fallback_is_rewritten_when_slot_frees():
+    registry, chars = make_glyphs(9)
+    display = glyph_display(registry)
+    display.load_screen([[{"text": "".join(chars)}]])
+    backend = display.get_backend()
+    # All nine glyphs are on screen, so the last one can't get a slot
+    assert backend.text()[0][:9] == "".join(chr(slot) for slot in range(8)) + "?"
+    # Dropping the first glyph frees its slot for the one shown as the fallback
+    display.load_screen([[{"text": " " + "".join(chars[1:])}]])
+    assert backend.cgram(0) == registry.bitmap(chars[8])
+    assert backend.text()[0][:9] == " " + "".join(chr(slot) for slot in range(1, 8)) + chr(0)
+
+
+def test_upload_forces_cursor_move():
+    registry, chars = make_glyphs(1)
+    display = glyph_display(registry)
+    display.load_screen([[{"text": "ab"}]])
+    backend = display.get_backend()
+    calls = []
+    for name in ("create_char", "set_cursor_pos", "print"):
+        method = getattr(backend, name)
+        setattr(backend, name, lambda *args, name=name, method=method: calls.append((name, args)) or method(*args))
+    # The cursor is already after "ab", but loading the glyph leaves it undefined
+    display.load_screen([[{"text": "ab" + chars[0]}]])
+    names = [name for name, args in calls]
+    assert names[:3] == ["create_char", "set_cursor_pos", "print"]
+    assert calls[1][1] == (0, 2)
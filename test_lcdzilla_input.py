@@ -0,0 +1,41 @@
+from conftest import make_display, make_menu
+from lcdzilla_input import InputDispatcher, ScriptedSource
+
+# Tests for the input dispatcher against the simulated display
+
+
+def test_keys_after_enter_go_to_next_screen():
+    display = make_display()
+    main_menu = make_menu(3, "Main", values=False)
+    sub_menu = make_menu(3, "Sub", values=False)
+    display.load_screen(main_menu)
+    dispatcher = InputDispatcher(display, on_enter=lambda selected: display.load_screen(sub_menu))
+    for key in ("enter", "down", "down"):
+        dispatcher.post(key)
+    assert dispatcher.dispatch() == [main_menu[0][0]]
+    assert display.get_screen() is sub_menu
+    assert display.get_cursor_position() == [2, 0]
+
+
+def test_burst_is_drawn_once():
+    display = make_display()
+    display.load_screen(make_menu(10, "Entry", values=False))
+    backend = display.get_backend()
+    backend.reset_stats()
+    dispatcher = InputDispatcher(display)
+    for key in ("down", "down", "down", "up"):
+        dispatcher.post(key)
+    assert dispatcher.dispatch() == []
+    assert display.get_cursor_position() == [2, 0]
+    # Only the final cursor position is sent
+    assert backend.stats()["operations"]["set_cursor_pos"]["count"] == 1
+
+
+def test_debounce_and_repeat():
+    display = make_display()
+    dispatcher = InputDispatcher(display, debounce=0.02, repeat_delay=0.5, repeat_interval=0.1)
+    dispatcher.add_source(ScriptedSource(["down"] * 8 + [()]))
+    for now in (0.0, 0.01, 0.03, 0.2, 0.53, 0.6, 0.63, 0.73, 0.8):
+        dispatcher.poll(now)
+    # Pressed once after the debounce time, then repeating every interval after the delay
+    assert dispatcher.pending() == 4
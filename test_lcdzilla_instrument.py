@@ -0,0 +1,65 @@
+from conftest import make_display, make_menu
+from lcdzilla_input import InputDispatcher
+from lcdzilla_instrument import TIME_BUCKETS, Instrumentation
+
+# Tests for the instrumentation of display operations
+
+
+def test_switch_screen_is_counted():
+    display = make_display()
+    instrumentation = Instrumentation()
+    display.set_instrumentation(instrumentation)
+    display.load_screen(make_menu(5))
+    display.switch_screen(make_menu(5, "Next"))
+    operations = instrumentation.snapshot()["operations"]
+    assert operations["load_screen"]["count"] == 1
+    assert operations["switch_screen"]["count"] == 1
+    assert operations["switch_screen"]["data_bytes"] > 0
+
+
+def test_snapshot_counts_and_histogram():
+    display = make_display()
+    instrumentation = Instrumentation()
+    menu = make_menu(10)
+    instrumentation.name_screen(menu, "main")
+    display.set_instrumentation(instrumentation)
+    display.load_screen(menu)
+    for _ in range(5):
+        display.cursor_down()
+    snapshot = instrumentation.snapshot()
+    operations = snapshot["operations"]
+    assert operations["navigate"]["count"] == 5
+    # The last two presses scroll and are counted under both operations
+    assert operations["scroll"]["count"] == 2
+    assert operations["navigate"]["data_bytes"] >= operations["scroll"]["data_bytes"] > 0
+    assert sum(operations["navigate"]["histogram"].values()) == 5
+    assert len(operations["navigate"]["histogram"]) == len(TIME_BUCKETS) + 1
+    assert snapshot["screens"]["main"]["count"] == 6
+    assert snapshot["lcd"]["data_bytes"] == display.get_backend().stats()["data_bytes"]
+
+
+def test_detach_restores_class_methods():
+    display = make_display()
+    backend = display.get_backend()
+    instrumentation = Instrumentation()
+    display.set_instrumentation(instrumentation)
+    assert "load_screen" in vars(display)
+    assert "print" in vars(backend)
+    display.set_instrumentation(None)
+    assert "load_screen" not in vars(display)
+    assert "cursor_down" not in vars(display)
+    assert "print" not in vars(backend)
+    display.load_screen(make_menu(3))
+    assert instrumentation.snapshot()["operations"] == {}
+
+
+def test_dispatcher_built_first_is_counted():
+    display = make_display()
+    dispatcher = InputDispatcher(display)
+    display.load_screen(make_menu(10))
+    instrumentation = Instrumentation()
+    display.set_instrumentation(instrumentation)
+    dispatcher.post("down")
+    dispatcher.post("down")
+    dispatcher.dispatch()
+    assert instrumentation.snapshot()["operations"]["navigate"]["count"] == 2
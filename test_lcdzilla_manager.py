@@ -0,0 +1,41 @@
+import pytest
+from conftest import FakeI2C
+from lcdzilla_manager import DisplayManager
+
+# Tests for the display manager with a fake I2C bus
+
+
+class LockCheckingI2C(FakeI2C):
+
+    # Also records whether the manager's bus lock was held for every write
+    def __init__(self):
+        super().__init__()
+        self.manager = None
+        self.locked = []
+
+    def writeto(self, addr, buffer, end=None):
+        super().writeto(addr, buffer, end)
+        self.locked.append(self.manager._bus_lock.locked())
+
+
+def test_all_bus_traffic_holds_the_bus_lock():
+    i2c = LockCheckingI2C()
+    manager = DisplayManager(i2c=i2c)
+    i2c.manager = manager
+    first = manager.add_display(0x27)
+    second = manager.add_display(0x26, priority=2)
+    first.load_screen([[{"text": "First"}]])
+    second.load_screen([[{"text": "Second"}]])
+    manager.flush()
+    assert {addr for addr, data in i2c.writes} == {0x26, 0x27}
+    assert all(i2c.locked)
+    assert not manager.pending()
+
+
+def test_priority_below_one_is_rejected():
+    manager = DisplayManager(i2c=FakeI2C())
+    with pytest.raises(Exception, match="at least 1"):
+        manager.add_display(0x27, priority=0)
+    display = manager.add_display(0x27)
+    with pytest.raises(Exception, match="at least 1"):
+        manager.set_priority(display, 0)
@@ -0,0 +1,78 @@
+from conftest import make_display, pad
+
+# Tests for editing number fields: stepping, clamping at the limits and acceleration
+
+
+def number_screen(value=50, min_value=0, max_value=100, step=1):
+    return [[{"text": "Level:"}],
+            [{"text": value, "select": True, "edit": True, "type": "number", "min_value": min_value,
+              "max_value": max_value, "step": step}]]
+
+
+def test_number_edit_clamps_at_max_and_min():
+    display = make_display()
+    screen = number_screen(value=98)
+    display.load_screen(screen)
+    for _ in range(5):
+        display.cursor_up()
+    assert screen[1][0]["text"] == 100
+    assert display.get_backend().text()[1] == pad("100")
+    display.load_screen(screen)
+    for _ in range(105):
+        display.cursor_down()
+    assert screen[1][0]["text"] == 0
+    assert display.get_backend().text()[1] == pad("0")
+
+
+def test_number_edit_accelerates_while_held():
+    display = make_display()
+    display.set_number_acceleration(10, 2)
+    screen = number_screen(value=0, max_value=1000)
+    display.load_screen(screen)
+    values = []
+    for _ in range(6):
+        display.cursor_up()
+        values.append(screen[1][0]["text"])
+    # Every two presses in a row the step grows ten times
+    assert values == [1, 2, 12, 22, 122, 222]
+    # Changing direction starts again from the field's own step
+    display.cursor_down()
+    assert screen[1][0]["text"] == 221
+
+
+def test_number_edit_slow_presses_do_not_accelerate():
+    display = make_display()
+    display.set_number_acceleration(0, 1)
+    screen = number_screen(value=0, step=5)
+    display.load_screen(screen)
+    for _ in range(3):
+        display.cursor_up()
+    assert screen[1][0]["text"] == 15
+
+
+def test_number_edit_rejects_out_of_range_value():
+    display = make_display()
+    screen = number_screen(value=150)
+    display.load_screen(screen)
+    assert display.enter() is None
+    assert display.get_backend().text()[3] == "Value must be <= 100".center(20)
+
+
+def test_number_edit_does_not_accelerate_by_default():
+    display = make_display()
+    screen = number_screen(value=0, max_value=None)
+    display.load_screen(screen)
+    for _ in range(50):
+        display.cursor_up()
+    assert screen[1][0]["text"] == 50
+
+
+def test_number_edit_acceleration_is_capped():
+    display = make_display()
+    display.set_number_acceleration(10, 1, max_exponent=2)
+    screen = number_screen(value=0, max_value=None)
+    display.load_screen(screen)
+    for _ in range(10):
+        display.cursor_up()
+    # 1 + 10 and then 100 for every press after that
+    assert screen[1][0]["text"] == 811
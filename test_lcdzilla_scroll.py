@@ -0,0 +1,54 @@
+from conftest import clears, make_display, make_menu, pad
+from lcdzilla_backend import CURSOR_BLINK
+
+# Tests for scrolling the visible window of a menu and keeping the cursor on it
+
+
+def test_cursor_moves_down_then_scrolls():
+    display = make_display()
+    display.load_screen(make_menu(10, values=False))
+    backend = display.get_backend()
+    assert backend.cursor_mode() == CURSOR_BLINK
+    for _ in range(3):
+        display.cursor_down()
+    assert display.get_cursor_position() == [3, 0]
+    assert backend.text()[0] == pad("Entry 0")
+    display.cursor_down()
+    # The window moved one row and the cursor stayed on the bottom display row
+    assert backend.text() == [pad("Entry {0}".format(row)) for row in range(1, 5)]
+    assert display.get_cursor_position() == [3, 0]
+    assert backend.cursor_pos() == [3, 0]
+    assert clears(display) == 0
+
+
+def test_cursor_stops_at_last_row():
+    display = make_display()
+    display.load_screen(make_menu(6, values=False))
+    for _ in range(10):
+        display.cursor_down()
+    assert display.get_backend().text() == [pad("Entry {0}".format(row)) for row in range(2, 6)]
+    assert display.get_cursor_position() == [3, 0]
+
+
+def test_cursor_up_scrolls_back():
+    display = make_display()
+    display.load_screen(make_menu(10, values=False), offset=3)
+    backend = display.get_backend()
+    assert backend.text()[0] == pad("Entry 3")
+    display.cursor_up()
+    assert backend.text() == [pad("Entry {0}".format(row)) for row in range(2, 6)]
+    assert display.get_cursor_position() == [0, 0]
+    assert display.enter()["text"] == "Entry 2"
+
+
+def test_scroll_skips_to_selectable_row():
+    display = make_display()
+    screen = make_menu(4, values=False) + [[{"text": "Footer"}]]
+    display.load_screen(screen)
+    for _ in range(3):
+        display.cursor_down()
+    # The new bottom row can't be selected so the cursor moves up to the nearest row that can
+    display.cursor_down()
+    assert display.get_backend().text()[3] == pad("Footer")
+    assert display.get_cursor_position() == [2, 0]
+    assert display.enter()["text"] == "Entry 3"
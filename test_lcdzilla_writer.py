@@ -0,0 +1,94 @@
+import threading
+import time
+import pytest
+from conftest import make_menu, pad
+from lcdzilla import lcdzilla
+from lcdzilla_backend import SimulatedBackend
+
+# Tests for the background writer thread, using a simulated display that can be held up
+
+
+class SlowBackend(SimulatedBackend):
+
+    # Every print waits until the gate is open, or takes `delay` seconds
+    def __init__(self, delay=0.0):
+        super().__init__()
+        self.delay = delay
+        self.gate = threading.Event()
+        self.gate.set()
+        self.writing = threading.Event()
+        self.error = None
+
+    def print(self, text):
+        self.writing.set()
+        self.gate.wait()
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        super().print(text)
+
+
+def slow_display(delay=0.0):
+    backend = SlowBackend(delay)
+    display = lcdzilla(lcdzilla.LCD_SIMULATED, None, None, None, backend=backend)
+    display.set_background_writer(True)
+    return display, backend
+
+
+def count_syncs(display):
+    syncs = []
+    sync_display = display.sync_display
+
+    def counted(*args, **kwargs):
+        syncs.append(True)
+        return sync_display(*args, **kwargs)
+
+    display.sync_display = counted
+    return syncs
+
+
+def test_flush_waits_for_latest_frame():
+    display, backend = slow_display(delay=0.005)
+    display.load_screen(make_menu(4, values=False))
+    for count in range(5):
+        display.load_status_line("Count {0}".format(count))
+    assert display.flush(timeout=5)
+    assert backend.text()[0] == pad("Entry 0")
+    assert backend.text()[3] == pad("Count 4".center(20))
+    display.set_background_writer(False)
+
+
+def test_burst_is_coalesced():
+    display, backend = slow_display()
+    syncs = count_syncs(display)
+    backend.gate.clear()
+    display.load_status_line("First")
+    assert backend.writing.wait(5)
+    # The writer is stuck on the first frame while these arrive
+    for count in range(20):
+        display.load_status_line("Count {0}".format(count))
+    backend.gate.set()
+    assert display.flush(timeout=5)
+    assert len(syncs) == 2
+    assert backend.text()[3] == pad("Count 19".center(20))
+    display.set_background_writer(False)
+
+
+def test_writer_error_is_raised_by_flush():
+    display, backend = slow_display()
+    backend.error = OSError("bus error")
+    display.load_status_line("Lost")
+    with pytest.raises(Exception, match="bus error"):
+        display.flush(timeout=5)
+    display.set_background_writer(False)
+
+
+def test_stopping_writer_writes_pending_changes():
+    display, backend = slow_display()
+    backend.gate.clear()
+    display.load_status_line("First")
+    assert backend.writing.wait(5)
+    display.load_status_line("Last")
+    threading.Timer(0.05, backend.gate.set).start()
+    display.set_background_writer(False)
+    assert backend.text()[3] == pad("Last".center(20))